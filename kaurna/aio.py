@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# asyncio versions of the kaurna functions, for services that can't afford to block their event loop on DynamoDB and
+# KMS round trips.  boto only speaks blocking HTTP, so every call here runs the synchronous implementation from
+# kaurna/__init__.py on a thread pool.  That keeps the stored item format identical no matter which API wrote it, and
+# lets many calls be in flight at once.  At most max_in_flight calls run concurrently per event loop; the rest wait.
+# Requires Python 3.5 or later, so unlike the rest of kaurna this module is not imported automatically.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import kaurna
+import threading
+import weakref
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+_lock = threading.Lock()
+_max_in_flight = DEFAULT_MAX_IN_FLIGHT
+_executor = None
+# one semaphore per event loop, since asyncio primitives can't be shared between loops
+_semaphores = weakref.WeakKeyDictionary()
+
+def configure(max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    # Changes the in-flight limit.  Calls that are already running aren't affected.
+    global _max_in_flight, _executor
+    with _lock:
+        _max_in_flight = max_in_flight
+        old_executor, _executor = _executor, None
+        _semaphores.clear()
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+    return
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_in_flight)
+        return _executor
+
+def _get_semaphore(loop):
+    with _lock:
+        if loop not in _semaphores:
+            _semaphores[loop] = asyncio.Semaphore(_max_in_flight)
+        return _semaphores[loop]
+
+async def _run(function, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    async with _get_semaphore(loop):
+        return await loop.run_in_executor(_get_executor(), functools.partial(function, *args, **kwargs))
+
+async def get_secret(secret_name, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.get_secret, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def get_secrets(secrets, region='us-east-1', **kwargs):
+    # same return format as kaurna.get_secrets, including exceptions in place of secrets that couldn't be loaded
+    return await _run(kaurna.get_secrets, list(secrets), region=region, **kwargs)
+
+async def store_secret(secret_name, secret, secret_version=None, authorized_entities=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.store_secret, secret_name=secret_name, secret=secret, secret_version=secret_version, authorized_entities=authorized_entities, region=region, **kwargs)
+
+async def describe_secrets(secret_name=None, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.describe_secrets, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def rotate_data_keys(secret_name=None, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.rotate_data_keys, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def update_secrets(secret_name, secret_version=None, authorized_entities=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.update_secrets, secret_name=secret_name, secret_version=secret_version, authorized_entities=authorized_entities, region=region, **kwargs)
+
+async def deprecate_secrets(secret_name=None, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.deprecate_secrets, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def activate_secrets(secret_name=None, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.activate_secrets, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def erase_secret(secret_name, secret_version=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.erase_secret, secret_name=secret_name, secret_version=secret_version, region=region, **kwargs)
+
+async def load_all_entries(secret_name=None, secret_version=None, region='us-east-1', attributes_to_get=None, **kwargs):
+    # boto's query/scan results are lazy generators that would make network calls when iterated on the event loop, so
+    # they're read fully on the worker thread.
+    return await _run(lambda: list(kaurna.load_all_entries(secret_name=secret_name, secret_version=secret_version, region=region, attributes_to_get=attributes_to_get, **kwargs)))
+
+async def import_secrets(records, authorized_entities=None, region='us-east-1', **kwargs):
+    # records is read on the worker thread, so pass a list or a file rather than an async iterator
+    return await _run(kaurna.import_secrets, records, authorized_entities=authorized_entities, region=region, **kwargs)
+
+async def secrets_for_entity(entity, region='us-east-1', **kwargs):
+    return await _run(kaurna.secrets_for_entity, entity, region=region, **kwargs)
+
+async def erase_secrets(secret_names=None, name_prefix=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.erase_secrets, secret_names=secret_names, name_prefix=name_prefix, region=region, **kwargs)
+
+async def migrate_secrets(secret_name=None, secret_version=None, format_version=2, region='us-east-1', **kwargs):
+    return await _run(kaurna.migrate_secrets, secret_name=secret_name, secret_version=secret_version, format_version=format_version, region=region, **kwargs)
+
+async def store_secret_stream(secret_name, stream, secret_version=None, authorized_entities=None, region='us-east-1', **kwargs):
+    return await _run(kaurna.store_secret_stream, secret_name=secret_name, stream=stream, secret_version=secret_version, authorized_entities=authorized_entities, region=region, **kwargs)
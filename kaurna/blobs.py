@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Blob stores hold the encrypted chunks of secrets stored with kaurna.store_secret_stream, which can be much bigger than
+# a DynamoDB item.  A store only ever sees ciphertext: it maps (blob_key, chunk number) to bytes.  The secret's item in
+# the kaurna table records the name of the store, the blob key and how many chunks there are, and kaurna checks that
+# it gets exactly that many back.
+#
+# By default chunks go to a DynamoDBBlobStore on the kaurna_chunks table, which lives in whichever storage backend kaurna
+# is configured with (see kaurna.storage).  Other stores are used by registering them with kaurna.register_blob_store
+# and passing their name to store_secret_stream.  Reads and erases look the store up by the name recorded on the item,
+# so the same store has to be registered in every process that reads those secrets.
+
+import errno
+import os
+
+from boto.dynamodb.types import Binary
+
+class BlobStore(object):
+    # The interface.  put is called with chunk numbers 0, 1, 2, ... in order, and a blob is never written to again once
+    # it's been read.
+
+    name = None
+
+    def put(self, blob_key, index, data):
+        raise NotImplementedError()
+
+    def read(self, blob_key, count):
+        # yields the first count chunks in order, stopping early if one is missing
+        raise NotImplementedError()
+
+    def delete(self, blob_key, count):
+        # missing chunks are ignored, so that a partly written or partly deleted blob can always be cleaned up
+        raise NotImplementedError()
+
+class DynamoDBBlobStore(BlobStore):
+    # One item per chunk, with the blob key as the hash key and the chunk number as the range key.  Reads are a query,
+    # which boto pages through lazily, so only a page of chunks is held in memory at a time.
+
+    name = 'dynamodb'
+
+    def __init__(self, table):
+        self.table = table
+
+    def put(self, blob_key, index, data):
+        self.table.new_item(hash_key=blob_key, range_key=index, attrs={'data': Binary(data)}).put()
+        return
+
+    def read(self, blob_key, count):
+        expected = 0
+        for item in self.table.query(hash_key=blob_key):
+            if expected == count or int(item['chunk']) != expected:
+                return
+            yield item['data'].value
+            expected += 1
+        return
+
+    def delete(self, blob_key, count):
+        for index in range(count):
+            self.table.new_item(hash_key=blob_key, range_key=index).delete()
+        return
+
+class LocalBlobStore(BlobStore):
+    # Keeps each chunk in its own file, directory/blob_key/chunk number, readable only by the current user.  Meant for
+    # hosts that keep large secrets on an encrypted local or network filesystem, and for testing.
+
+    def __init__(self, directory, name='local'):
+        self.directory = directory
+        self.name = name
+
+    def _path(self, blob_key, index=None):
+        if os.sep in blob_key or blob_key.startswith('.'):
+            raise Exception('Invalid blob key \'{0}\'.'.format(blob_key))
+        return os.path.join(self.directory, blob_key) if index is None else os.path.join(self.directory, blob_key, '{0:08d}'.format(index))
+
+    def put(self, blob_key, index, data):
+        try:
+            os.makedirs(self._path(blob_key), 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # written to a temporary file and renamed into place, so a chunk is either all there or not there at all
+        temp_path = self._path(blob_key, index) + '.tmp'
+        with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, self._path(blob_key, index))
+        return
+
+    def read(self, blob_key, count):
+        for index in range(count):
+            try:
+                with open(self._path(blob_key, index), 'rb') as f:
+                    data = f.read()
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return
+            yield data
+        return
+
+    def delete(self, blob_key, count):
+        for index in range(count):
+            try:
+                os.remove(self._path(blob_key, index))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        try:
+            os.rmdir(self._path(blob_key))
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTEMPTY):
+                raise
+        return
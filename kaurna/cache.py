@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict
+import random
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# Sentinel for "not in the cache", since None could in theory be a cached value.
+MISSING = object()
+
+class LRUCache(object):
+    # A thread-safe least-recently-used cache.  Entries can expire after ttl seconds or after being handed out max_uses
+    # times, and the cache is kept under max_entries entries and max_bytes bytes (as reported by the size passed to put)
+    # by evicting the least recently used entries.  Any of the limits can be None to disable it.  If jitter is set, each
+    # entry's ttl is shortened by a random fraction of up to jitter, so entries stored at the same time don't all expire
+    # at the same time.
+
+    def __init__(self, ttl=None, max_entries=None, max_bytes=None, max_uses=None, jitter=0.0, clock=time.time):
+        self.ttl = ttl
+        self.jitter = jitter
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_uses = max_uses
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> [value, expiry time (or None), size, times handed out]
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # key -> _Flight for loads currently running in get_or_load
+        self._in_flight = {}
+        # bumped by every invalidation, so a load that started before an invalidation doesn't cache what it read
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.exhausted = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self.peek(key) is not MISSING
+
+    def peek(self, key):
+        # Same as get, but doesn't count as a hit/miss or bump the entry's recency.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                return MISSING
+            return entry[0]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            entry[3] += 1
+            if self.max_uses is not None and entry[3] >= self.max_uses:
+                # this is the last time this entry may be used
+                self._remove(key)
+                self.exhausted += 1
+            else:
+                # re-inserting moves the key to the most-recently-used end
+                del self._entries[key]
+                self._entries[key] = entry
+            return entry[0]
+
+    def get_or_load(self, key, loader, size=None):
+        # Returns the cached value for key, or calls loader() to produce it.  If several threads miss on the same key at
+        # once, only one of them calls loader and the rest wait for (and share) its result or exception.  size, if
+        # given, is a function returning the size of a loaded value.
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        return self._load(key, loader, size)
+
+    def _load(self, key, loader, size=None):
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight(self._generation)
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            with self._lock:
+                if flight.generation == self._generation:
+                    self.put(key, flight.value, size=size(flight.value) if size else 0)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+        return flight.value
+
+    def put(self, key, value, size=0, ttl=MISSING, uses=0):
+        # uses is how many times the value has already been used, e.g. 1 if the caller just loaded it to use it.  An
+        # entry with no uses left isn't stored at all.
+        ttl = self.ttl if ttl is MISSING else ttl
+        if ttl is not None and self.jitter:
+            ttl = ttl * (1 - random.uniform(0, self.jitter))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # this would evict everything else and still not fit, so don't bother
+                return False
+            if self.max_uses is not None and uses >= self.max_uses:
+                self.exhausted += 1
+                return False
+            self._entries[key] = [value, None if ttl is None else self._clock() + ttl, size, uses]
+            self._bytes += size
+            self._evict()
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if key in self._entries:
+                self._remove(key)
+                return True
+            return False
+
+    def invalidate_matching(self, predicate):
+        # Removes every entry whose key satisfies predicate, and returns how many were removed.
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                self._remove(key)
+        return
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'exhausted': self.exhausted,
+                'coalesced': self.coalesced,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+                }
+
+    def _expired(self, entry):
+        return entry[1] is not None and entry[1] <= self._clock()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+        return entry
+
+    def _evict(self):
+        # The first entry in the OrderedDict is always the least recently used one.
+        while self._entries and ((self.max_entries is not None and len(self._entries) > self.max_entries) or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return
+
+class _Flight(object):
+    # one in-progress load in LRUCache.get_or_load
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class RefreshingCache(LRUCache):
+    # An LRUCache that refreshes entries before they expire instead of letting a caller pay for the reload.  Once an
+    # entry loaded through get_or_load is older than refresh_ahead * its ttl, callers keep getting the cached value while
+    # a single background thread reloads it with the same loader.  If the refresh fails, the old value is served until it
+    # really expires, after which callers load it themselves (coalesced, as in LRUCache.get_or_load).
+
+    def __init__(self, ttl, refresh_ahead=0.8, **kwargs):
+        LRUCache.__init__(self, ttl=ttl, **kwargs)
+        self.refresh_ahead = refresh_ahead
+        self._refresh_at = {}
+        self._loaders = {}
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._thread = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def get_or_load(self, key, loader, size=None):
+        with self._lock:
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                self._loaders[key] = (loader, size)
+                if self._refresh_at.get(key, float('inf')) <= self._clock():
+                    self._schedule_refresh(key)
+                return value
+        value = self._load(key, loader, size)
+        with self._lock:
+            if key in self._entries:
+                self._loaders[key] = (loader, size)
+        return value
+
+    def put(self, key, value, size=0, ttl=MISSING):
+        with self._lock:
+            stored = LRUCache.put(self, key, value, size=size, ttl=ttl)
+            if stored and key in self._entries and self._entries[key][1] is not None:
+                now = self._clock()
+                self._refresh_at[key] = now + (self._entries[key][1] - now) * self.refresh_ahead
+            return stored
+
+    def wait_for_refreshes(self):
+        # blocks until every refresh scheduled so far has finished; mostly useful for tests
+        self._queue.join()
+        return
+
+    def close(self):
+        # stops the background thread once it's done with what's already queued
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(MISSING)
+                self._thread = None
+        return
+
+    def stats(self):
+        stats = LRUCache.stats(self)
+        stats['refreshes'] = self.refreshes
+        stats['refresh_failures'] = self.refresh_failures
+        return stats
+
+    def _remove(self, key):
+        self._refresh_at.pop(key, None)
+        self._loaders.pop(key, None)
+        return LRUCache._remove(self, key)
+
+    def _schedule_refresh(self, key):
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, args=(self._queue,))
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put(key)
+        return
+
+    def _refresh_loop(self, refresh_queue):
+        while True:
+            key = refresh_queue.get()
+            try:
+                if key is MISSING:
+                    return
+                with self._lock:
+                    self._queued.discard(key)
+                    # skip entries that were evicted or invalidated while they were queued
+                    loader = self._loaders.get(key) if key in self._entries else None
+                if loader is None:
+                    continue
+                try:
+                    self._load(key, loader[0], loader[1])
+                    self.refreshes += 1
+                except Exception:
+                    self.refresh_failures += 1
+            finally:
+                refresh_queue.task_done()
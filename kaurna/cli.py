@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 
 import argparse
+import json
 import kaurna
+from kaurna.blobs import LocalBlobStore
+import kaurna.server
+import sys
 
 class CLIDispatcher:
 
@@ -23,7 +27,7 @@ class CLIDispatcher:
             'initial':'s'
             },
         'erase_secret':{
-            'help':'Erase the provided secret from kaurna.  Can be used to delete all versions of a secret, but cannot be used to delete all secrets at once.  For that, use --delete-all-the-things.',
+            'help':'Erase the provided secret from kaurna, or every secret starting with --name-prefix.  Can be used to delete all versions of a secret, but cannot be used to delete all secrets at once.  For that, use --delete-all-the-things.',
             'initial':'e'
             },
         'deprecate_secrets':{
@@ -42,14 +46,47 @@ class CLIDispatcher:
             'help':'Download the desired secret.  This will print it to stdout; if you don\'t want it to appear on the screen, you can pipe the output of this command to a file or to a clipboard program like pbcopy or xclip (which one to use varies based on your OS).',
             'initial':'g'
             },
+        'import_secrets':{
+            'help':'Store many new secrets at once from --input, which holds either one JSON object per line ({"secret_name": ..., "secret": ..., "authorized_entities": [...]}) or NAME=value lines as in a .env file.  Secrets without their own authorized_entities get --authorized-entities.',
+            'initial':'i'
+            },
+        'secrets_for_entity':{
+            'help':'List the secret names and versions that --entity is an authorized entity of, using the entity index instead of scanning every secret.',
+            'initial':None
+            },
+        'rebuild_entity_index':{
+            'help':'Make the entity index used by secrets-for-entity match the stored secrets.  Run this once on tables created before the index existed.',
+            'initial':None
+            },
+        'migrate_secrets':{
+            'help':'Rewrite the provided secret, or all secrets if no secret name is provided, in item format --format-version (2 if not provided).  Each item keeps its data key, and items already in that format are left alone.',
+            'initial':None
+            },
+        'serve':{
+            'help':'Run a local daemon that keeps warm connections and a cache of decrypted secrets, and answers get-secret and list-secrets requests from --use-daemon over a unix socket.  Runs until interrupted.',
+            'initial':None
+            },
         'erase_all_the_things':{
             'help':'Erase every secret.  Only use this as a last resort.  Even if you pass in --force, this will require a prompt.',
             'initial':None
             }
         }
     
+    def _daemon_client(self, **kwargs):
+        # returns a client for the local daemon if --use-daemon was passed and a daemon is running, otherwise None
+        if not kwargs.get('use_daemon'):
+            return None
+        client = kaurna.server.SecretClient(kwargs['socket'])
+        return client if client.available() else None
+
     def list_secrets(self, **kwargs):
-        secrets = kaurna.describe_secrets(secret_name=kwargs['secret_name'], secret_version=kwargs['secret_version'], region=kwargs['region'])
+        if kwargs['format'] == 'jsonl':
+            # one JSON object per secret version, printed as soon as it's read so that huge tables can be piped elsewhere
+            for record in kaurna.iter_secrets(secret_name=kwargs['secret_name'], secret_version=kwargs['secret_version'], region=kwargs['region'], segments=kwargs['segments']):
+                sys.stdout.write(json.dumps(record) + '\n')
+                sys.stdout.flush()
+            return
+        secrets = (self._daemon_client(**kwargs) or kaurna).describe_secrets(secret_name=kwargs['secret_name'], secret_version=kwargs['secret_version'], region=kwargs['region'], segments=kwargs['segments'])
         for secret in secrets.keys():
             print('Secret name: {0}'.format(secret))
             for version in secrets[secret].keys():
@@ -58,12 +95,25 @@ class CLIDispatcher:
                 print('    Deprecated:             {0}'.format('Yes' if secrets[secret][version]['deprecated'] else 'No'))
                 print('    Created:                {0}'.format(secrets[secret][version]['create_date']))
                 print('    Last data key rotation: {0}'.format(secrets[secret][version]['last_data_key_rotation']))
+                if secrets[secret][version].get('secret_size') is not None:
+                    print('    Size:                   {0} bytes, stored as {1} bytes{2}'.format(secrets[secret][version]['secret_size'], secrets[secret][version]['stored_size'], ' ({0} compressed)'.format(secrets[secret][version]['compression']) if secrets[secret][version]['compression'] else ''))
     
     def rotate_keys(self, **kwargs):
-        kaurna.rotate_data_keys(**kwargs)
+        summary = kaurna.rotate_data_keys(older_than=kwargs['older_than_days'] * 86400 if kwargs['older_than_days'] else None, **kwargs)
+        if summary:
+            print('Rotated {0} items in {1:.2f} seconds ({2} already done).'.format(summary['processed'], summary['seconds'], summary['skipped']))
     
     def store_secret(self, **kwargs):
-        kaurna.store_secret(**kwargs)
+        if not kwargs['secret_file']:
+            kaurna.store_secret(**kwargs)
+            return
+        # read and stored a chunk at a time, so the secret can be bigger than both the command line and a DynamoDB item
+        stream = getattr(sys.stdin, 'buffer', sys.stdin) if kwargs['secret_file'] == '-' else open(kwargs['secret_file'], 'rb')
+        try:
+            kaurna.store_secret_stream(stream=stream, blob_store='local' if kwargs['blob_dir'] else None, **kwargs)
+        finally:
+            if kwargs['secret_file'] != '-':
+                stream.close()
     
     def create_kaurna_key(self, **kwargs):
         print('About to create the kaurna KMS key.')
@@ -80,8 +130,8 @@ class CLIDispatcher:
             print('KMS key with alias \'kaurna\' already exists.  No need to create.')
 
     def erase_secret(self, **kwargs):
-        if not kwargs['secret_name']:
-            print('Must provide secret_name.')
+        if bool(kwargs['secret_name']) == bool(kwargs['name_prefix']):
+            print('Must provide exactly one of secret_name and name_prefix.')
             exit(1)
         print('About to delete the following secrets:')
         secrets = kaurna.load_all_entries(attributes_to_get=['secret_name','secret_version'], **kwargs)
@@ -94,7 +144,11 @@ class CLIDispatcher:
             if response.strip().lower() not in ['y','yes']:
                 print('Aborted.')
                 exit(1)
-        kaurna.erase_secret(**kwargs)
+        if kwargs['name_prefix']:
+            erased = kaurna.erase_secrets(name_prefix=kwargs['name_prefix'], region=kwargs['region'], segments=kwargs['segments'])
+        else:
+            erased = kaurna.erase_secret(**kwargs)
+        print('Erased {0} secrets.'.format(erased))
     
     # hasn't yet been manually tested in its latest form
     def deprecate_secrets(self, **kwargs):
@@ -111,18 +165,59 @@ class CLIDispatcher:
                 if response.strip().lower() not in ['y','yes']:
                     print('Aborted.')
                     exit(1)
-            kaurna.deprecate_secrets(**kwargs)
+            print('Deprecated {0} secrets.'.format(kaurna.deprecate_secrets(**kwargs)))
         else:
             print('No active secrets matching those parameters found.')
 
     def activate_secrets(self, **kwargs):
-        kaurna.activate_secrets(**kwargs)
+        print('Activated {0} secrets.'.format(kaurna.activate_secrets(**kwargs)))
     
     def update_secrets(self, **kwargs):
-        kaurna.update_secrets(**kwargs)
+        summary = kaurna.update_secrets(**kwargs)
+        print('Updated {0} secrets; {1} already had those authorized entities.'.format(summary['changed'], summary['unchanged']))
     
     def get_secret(self, **kwargs):
-        print(kaurna.get_secret(**kwargs))
+        if not kwargs['output']:
+            print((self._daemon_client(**kwargs) or kaurna).get_secret(**kwargs))
+            return
+        # written out a chunk at a time, exactly as stored (no trailing newline added)
+        output = getattr(sys.stdout, 'buffer', sys.stdout) if kwargs['output'] == '-' else open(kwargs['output'], 'wb')
+        try:
+            for plaintext in kaurna.get_secret_stream(**kwargs):
+                output.write(plaintext)
+        finally:
+            if kwargs['output'] == '-':
+                output.flush()
+            else:
+                output.close()
+
+    def import_secrets(self, **kwargs):
+        input_file = sys.stdin if kwargs['input'] == '-' else open(kwargs['input'])
+        try:
+            summary = kaurna.import_secrets(input_file, authorized_entities=kwargs['authorized_entities'], format=kwargs['input_format'], region=kwargs['region'], format_version=kwargs['format_version'], compression=kwargs['compression'], compression_threshold=kwargs['compression_threshold'])
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+        print('Imported {0} secrets in {1:.2f} seconds ({2:.1f} secrets/second).'.format(summary['imported'], summary['seconds'], summary['secrets_per_second']))
+
+    def secrets_for_entity(self, **kwargs):
+        if not kwargs['entity']:
+            print('Must provide entity.')
+            exit(1)
+        for secret_name, secret_version in kaurna.secrets_for_entity(**kwargs):
+            print('Name: {0}, version {1}'.format(secret_name, secret_version))
+
+    def rebuild_entity_index(self, **kwargs):
+        summary = kaurna.rebuild_entity_index(**kwargs)
+        print('Added {0} and removed {1} entity index entries.'.format(summary['added'], summary['removed']))
+
+    def migrate_secrets(self, **kwargs):
+        summary = kaurna.migrate_secrets(secret_name=kwargs['secret_name'], secret_version=kwargs['secret_version'], format_version=kwargs['format_version'] or 2, region=kwargs['region'], segments=kwargs['segments'])
+        print('Migrated {0} secrets; {1} were already in that format.'.format(summary['migrated'], summary['unchanged']))
+
+    def serve(self, **kwargs):
+        print('Serving kaurna secrets on {0}.'.format(kwargs['socket']))
+        kaurna.server.serve(socket_path=kwargs['socket'], cache_ttl=kwargs['cache_ttl'])
     
     def erase_all_the_things(self, **kwargs):
         seriously=False
@@ -154,10 +249,34 @@ class CLIDispatcher:
                 operations.add_argument(operation_cli, action='store_true', help='Operation: {0}'.format(op['help']))
 
         parser.add_argument('--region', default='us-east-1', help='Argument: The AWS region to use.')
+        parser.add_argument('--key-provider', default=None, help='Argument: What generates and unwraps the data keys: kms (the default) or local:MASTER_KEY_FILE for a software KMS meant for development and benchmarking.  Optional for all calls.')
+        parser.add_argument('--storage', default=None, help='Argument: Where kaurna keeps its tables: dynamodb (the default), memory (gone when the command exits, so mostly useful with --serve) or sqlite:PATH for a SQLite database file.  Optional for all calls.')
         parser.add_argument('--secret-name', default=None, help='Argument: The name of the secret.  Required for erase-secret, store-secret, and get-secret.  Optional for list-secrets, rotate-keys, deprecate-secrets, activate-secrets, and update-secrets.')
         parser.add_argument('--secret-version', default=None, help='Argument: The version of the secret to use.  If this is provided, secret-name must also be provided.  Optional for list-secrets, rotate-keys, store-secret, erase-secrets, deprecate-secrets, activate-secrets, update-secrets, and get-secret.')
+        parser.add_argument('--name-prefix', default=None, help='Argument: Erase every version of every secret whose name starts with this, instead of a single --secret-name.  Optional for erase-secret.')
         parser.add_argument('--secret', default=None, help='Argument: The secret to store.  Currently the only way to enter it is here, but I\'ll add a way to enter it that doesn\'t display it later.  Required for store-secret.')
+        parser.add_argument('--secret-file', default=None, help='Argument: Read the secret to store from this file, or - for stdin, instead of --secret.  The secret is stored in encrypted chunks outside the kaurna table, so it can be any size.  Optional for store-secret.')
+        parser.add_argument('--output', default=None, help='Argument: Write the secret to this file, or - for stdout, a chunk at a time instead of printing it.  Use this for secrets stored with --secret-file.  Optional for get-secret.')
+        parser.add_argument('--blob-dir', default=None, help='Argument: Keep the chunks of secrets stored with --secret-file in this local directory instead of the kaurna_chunks table.  Needed for every later get-secret, rotate-keys, update-secrets and erase-secret of those secrets.')
         parser.add_argument('--authorized-entities', nargs='+', help='Argument: The entities that should have permission to access the secret(s).  Optional for update-secrets and store-secret; if not provided the empty list will be used.')
+        parser.add_argument('--format', choices=['text', 'jsonl'], default='text', help='Argument: How to print secrets.  jsonl prints one JSON object per secret version as it is read, instead of waiting for the whole listing; it always reads from AWS directly, even with --use-daemon.  Optional for list-secrets.')
+        parser.add_argument('--format-version', type=int, choices=kaurna.FORMAT_VERSIONS, default=None, help='Argument: The item format to write: 1 is base64 text encrypted with AES-CBC, 2 is binary encrypted with AES-GCM (needs pycryptodome).  Optional for store-secret and import-secrets, which default to 1, and for migrate-secrets, which defaults to 2.')
+        parser.add_argument('--compression', choices=sorted(kaurna.COMPRESSION_ALGORITHMS), default=None, help='Argument: Compress secrets with this algorithm before encrypting them, if that makes them smaller.  Optional for store-secret and import-secrets.')
+        parser.add_argument('--compression-threshold', type=int, default=None, help='Argument: Only compress secrets of at least this many bytes (default {0}).  Optional for store-secret and import-secrets.'.format(kaurna.COMPRESSION_THRESHOLD))
+        parser.add_argument('--segments', type=int, default=None, help='Argument: When no secret name is given, read the table with this many parallel scan segments instead of one scan.  Optional for list-secrets, rotate-keys, deprecate-secrets, activate-secrets and migrate-secrets.')
+        parser.add_argument('--workers', type=int, default=None, help='Argument: Rotate this many items at a time instead of one after another.  Optional for rotate-keys.')
+        parser.add_argument('--rate-limit', type=float, default=None, help='Argument: Rotate at most this many items per second.  Optional for rotate-keys.')
+        parser.add_argument('--checkpoint', default=None, help='Argument: A file to record rotation progress in, so that an interrupted rotation can be continued with --resume.  The file is removed when the rotation finishes.  Optional for rotate-keys.')
+        parser.add_argument('--resume', action='store_true', help='Argument: Continue the rotation recorded in --checkpoint instead of starting over.  Optional for rotate-keys.')
+        parser.add_argument('--force-rotate', action='store_true', help='Argument: Rotate the data keys of versions whose authorized entities wouldn\'t change, instead of skipping them.  Optional for update-secrets.')
+        parser.add_argument('--older-than-days', type=float, default=None, help='Argument: Only rotate data keys that were last rotated more than this many days ago.  Optional for rotate-keys.')
+        parser.add_argument('--rewrap', action='store_true', help='Argument: Instead of generating new data keys, re-wrap the existing ones for the current authorized entities with KMS ReEncrypt.  Cheaper, and the stored secrets aren\'t re-encrypted.  Optional for rotate-keys and update-secrets.')
+        parser.add_argument('--input', default='-', help='Argument: The file to read secrets from, or - for stdin.  Optional for import-secrets.')
+        parser.add_argument('--input-format', choices=['jsonl', 'dotenv'], default=None, help='Argument: The format of --input.  If not provided, lines starting with { are read as JSON and everything else as NAME=value.  Optional for import-secrets.')
+        parser.add_argument('--entity', default=None, help='Argument: The authorized entity to look up.  Required for secrets-for-entity.')
+        parser.add_argument('--socket', default=kaurna.server.DEFAULT_SOCKET_PATH, help='Argument: The unix socket the kaurna daemon listens on.  Optional for serve, and for get-secret and list-secrets with --use-daemon.')
+        parser.add_argument('--use-daemon', action='store_true', help='Argument: Read through the local kaurna daemon (see --serve) if one is running, instead of talking to AWS directly.  Falls back to AWS if the daemon isn\'t running.  Optional for get-secret and list-secrets.')
+        parser.add_argument('--cache-ttl', type=int, default=300, help='Argument: How many seconds the daemon may serve a decrypted secret from memory before reloading it.  Optional for serve.')
         parser.add_argument('-f', '--force', action='store_true', help='Argument: Skip normal confirmation prompts.  Optional for all calls.  Ignored by erase-all-the-things.')
         parser.add_argument('-v', '--verbose', action='store_true', help='Argument: Print random usually-useless information.  May or may not print anything depending on whether or not I\'ve implemented it yet, as I haven\'t right now.  Optional for all calls.')
 
@@ -171,6 +290,12 @@ class CLIDispatcher:
                 operation = operation if not pair[1] else pair[0]
             else:
                 argdict[pair[0]] = pair[1]
+        if argdict.get('key_provider'):
+            kaurna.configure_key_provider(argdict['key_provider'])
+        if argdict.get('storage'):
+            kaurna.configure_storage(argdict['storage'])
+        if argdict.get('blob_dir'):
+            kaurna.register_blob_store(LocalBlobStore(argdict['blob_dir']))
         try:
             getattr(self, operation)(**argdict)
         except Exception as e:
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+# Key providers generate kaurna's data keys and wrap and unwrap them under a master key, bound to an encryption
+# context.  kaurna calls a provider's client through the part of boto.kms's interface it has always used:
+# generate_data_key, encrypt, decrypt and re_encrypt, plus list_aliases for create_kaurna_key.  KMSKeyProvider therefore
+# just hands out boto's KMS connections, and LocalKeyProvider implements the same calls in software, with the same
+# arguments, responses and errors, so the rest of kaurna doesn't care which one it's using.  Pick one with
+# kaurna.configure_key_provider.
+#
+# LocalKeyProvider is for development, tests and benchmarks, not for protecting real secrets: anyone who can read the
+# master key file can read every secret.  It can add latency to every call and throttle calls above a given rate, so
+# that the full envelope-encryption path can be load-tested offline with KMS-like costs.
+
+import base64
+import errno
+import hashlib
+import hmac
+import json
+import os
+import random
+import struct
+import threading
+import time
+
+from boto.exception import JSONResponseError
+from boto.kms.exceptions import InvalidCiphertextException, NotFoundException
+from Crypto.Cipher import AES
+from Crypto import Random
+
+# data key lengths by key_spec, as in KMS
+KEY_SPEC_BYTES = {'AES_256': 32, 'AES_128': 16}
+
+# the first byte of every ciphertext blob a LocalKeyProvider makes
+LOCAL_BLOB_VERSION = b'\x01'
+
+class KeyProvider(object):
+    # The interface.  get_client returns the object kaurna makes its KMS calls on for the given region.
+
+    name = None
+
+    def get_client(self, region='us-east-1'):
+        raise NotImplementedError()
+
+class KMSKeyProvider(KeyProvider):
+    # The default.  connect(region) returns a boto.kms connection for the region.
+
+    name = 'kms'
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def get_client(self, region='us-east-1'):
+        return self.connect(region)
+
+class LocalKeyProvider(KeyProvider):
+    # A software KMS with a single master key, kept base64-encoded in master_key_file, which is created (readable only by
+    # the current user) if it doesn't exist.  'alias/kaurna' and the key's own id both name it, in every region.
+    # Data keys are wrapped with AES-CBC and an HMAC-SHA256 over the ciphertext and the canonical encryption context,
+    # so, as with KMS, decrypting with a different encryption context than the one used to encrypt fails with
+    # InvalidCiphertextException.
+    # latency seconds (plus up to jitter more, at random) are slept before every call.  If max_requests_per_second is
+    # given, calls beyond that rate (with bursts of up to burst calls) fail with a ThrottlingException, like KMS's
+    # request quotas.
+
+    name = 'local'
+
+    def __init__(self, master_key_file, latency=0.0, jitter=0.0, max_requests_per_second=None, burst=None, clock=time.time, sleep=time.sleep):
+        self.master_key_file = master_key_file
+        master_key = _load_or_create_master_key(master_key_file)
+        self.key_id = 'local/' + hashlib.sha256(master_key).hexdigest()[:32]
+        self._encryption_key = hmac.new(master_key, b'kaurna local encryption key', hashlib.sha256).digest()
+        self._mac_key = hmac.new(master_key, b'kaurna local mac key', hashlib.sha256).digest()
+        self.latency = latency
+        self.jitter = jitter
+        self.max_requests_per_second = max_requests_per_second
+        self.burst = burst or max_requests_per_second
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last_refill = clock()
+        self._counts = {'generate_data_key': 0, 'encrypt': 0, 'decrypt': 0, 're_encrypt': 0, 'throttled': 0}
+
+    def get_client(self, region='us-east-1'):
+        return self
+
+    def stats(self):
+        # how many of each call were made, and how many of them were throttled
+        with self._lock:
+            return dict(self._counts)
+
+    def _call(self, operation):
+        # the injected latency and throttling, applied to every call
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            self._sleep(delay)
+        with self._lock:
+            self._counts[operation] += 1
+            if self.max_requests_per_second:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.max_requests_per_second)
+                self._last_refill = now
+                if self._tokens < 1:
+                    self._counts['throttled'] += 1
+                    raise JSONResponseError(400, 'Bad Request', body={'__type': 'ThrottlingException', 'message': 'Rate exceeded'})
+                self._tokens -= 1
+        return
+
+    def _check_key_id(self, key_id):
+        if key_id not in ('alias/kaurna', self.key_id):
+            raise NotFoundException(400, 'Bad Request', body={'__type': 'NotFoundException', 'message': 'Key \'{0}\' does not exist'.format(key_id)})
+        return
+
+    def _mac(self, iv, ciphertext, encryption_context):
+        context = json.dumps(encryption_context or {}, sort_keys=True).encode('utf-8')
+        return hmac.new(self._mac_key, LOCAL_BLOB_VERSION + iv + ciphertext + context, hashlib.sha256).digest()
+
+    def _wrap(self, plaintext, encryption_context):
+        iv = Random.new().read(AES.block_size)
+        padding = AES.block_size - len(plaintext) % AES.block_size
+        ciphertext = AES.new(self._encryption_key, AES.MODE_CBC, iv).encrypt(plaintext + struct.pack('B', padding) * padding)
+        return LOCAL_BLOB_VERSION + iv + ciphertext + self._mac(iv, ciphertext, encryption_context)
+
+    def _unwrap(self, ciphertext_blob, encryption_context):
+        iv, ciphertext, mac = ciphertext_blob[1:1 + AES.block_size], ciphertext_blob[1 + AES.block_size:-32], ciphertext_blob[-32:]
+        if ciphertext_blob[:1] != LOCAL_BLOB_VERSION or not ciphertext or len(ciphertext) % AES.block_size or not hmac.compare_digest(mac, self._mac(iv, ciphertext, encryption_context)):
+            raise InvalidCiphertextException(400, 'Bad Request', body={'__type': 'InvalidCiphertextException', 'message': None})
+        plaintext = AES.new(self._encryption_key, AES.MODE_CBC, iv).decrypt(ciphertext)
+        return plaintext[:-struct.unpack('B', plaintext[-1:])[0]]
+
+    # The KMS calls.  Arguments and responses match boto.kms.layer1.KMSConnection.
+
+    def generate_data_key(self, key_id, encryption_context=None, number_of_bytes=None, key_spec=None, grant_tokens=None):
+        self._call('generate_data_key')
+        self._check_key_id(key_id)
+        plaintext = Random.new().read(number_of_bytes or KEY_SPEC_BYTES[key_spec or 'AES_256'])
+        return {'Plaintext': plaintext, 'CiphertextBlob': self._wrap(plaintext, encryption_context), 'KeyId': self.key_id}
+
+    def encrypt(self, key_id, plaintext, encryption_context=None, grant_tokens=None):
+        self._call('encrypt')
+        self._check_key_id(key_id)
+        return {'CiphertextBlob': self._wrap(plaintext, encryption_context), 'KeyId': self.key_id}
+
+    def decrypt(self, ciphertext_blob, encryption_context=None, grant_tokens=None):
+        self._call('decrypt')
+        return {'Plaintext': self._unwrap(ciphertext_blob, encryption_context), 'KeyId': self.key_id}
+
+    def re_encrypt(self, ciphertext_blob, destination_key_id, source_encryption_context=None, destination_encryption_context=None, grant_tokens=None):
+        self._call('re_encrypt')
+        self._check_key_id(destination_key_id)
+        plaintext = self._unwrap(ciphertext_blob, source_encryption_context)
+        return {'CiphertextBlob': self._wrap(plaintext, destination_encryption_context), 'SourceKeyId': self.key_id, 'KeyId': self.key_id}
+
+    def list_aliases(self, limit=None, marker=None):
+        return {'Truncated': False, 'Aliases': [{'AliasName': 'alias/kaurna', 'AliasArn': 'alias/kaurna', 'TargetKeyId': self.key_id}]}
+
+def _load_or_create_master_key(path):
+    try:
+        with open(path, 'rb') as f:
+            master_key = base64.b64decode(f.read().strip())
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        master_key = Random.new().read(32)
+        # O_EXCL, so that two processes starting at once can't each write a different key
+        try:
+            with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+                f.write(base64.b64encode(master_key) + b'\n')
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return _load_or_create_master_key(path)
+    if len(master_key) != 32:
+        raise Exception('The master key in {0} should be 32 bytes, not {1}.'.format(path, len(master_key)))
+    return master_key
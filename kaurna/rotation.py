@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+# The engine behind rotate_data_keys(workers=...).  Items are streamed a page at a time into a bounded queue that a
+# fixed pool of worker threads drains, so memory use doesn't grow with the table and the scan only runs as far ahead of
+# the workers as the queue allows.  An optional rate limit caps how many items are processed per second across all
+# workers, to stay under KMS and DynamoDB request quotas.
+#
+# If a checkpoint file is given, it's rewritten as work completes with the key of the last page whose items are all
+# done plus the set of items finished after that page: whenever that page moves on, every CHECKPOINT_EVERY_ITEMS items
+# or CHECKPOINT_EVERY_SECONDS seconds otherwise, and once more at the end.  Running again with resume=True starts the
+# scan from that key and skips the finished items.  The file is removed once everything has been processed.
+
+import json
+import os
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# While the oldest page can't move on (say an item in it failed), the checkpoint is only rewritten after this many more
+# items have finished or this many seconds have passed, as each write holds every item finished since that page.
+CHECKPOINT_EVERY_ITEMS = 1000
+CHECKPOINT_EVERY_SECONDS = 10.0
+
+class RateLimiter(object):
+    # Spaces calls to acquire() at least 1/rate seconds apart, across all threads using the limiter.
+
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.interval = 1.0 / rate
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            self._sleep(wait)
+        return
+
+def load_checkpoint(path):
+    # returns (key to start the scan after, set of keys already processed past it)
+    with open(path) as f:
+        checkpoint = json.load(f)
+    start_key = checkpoint['last_evaluated_key']
+    return (tuple(start_key) if start_key is not None else None, set(tuple(key) for key in checkpoint['completed']))
+
+def save_checkpoint(path, last_evaluated_key, completed):
+    # written to a temporary file and renamed into place, so a crash never leaves a half-written checkpoint
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'last_evaluated_key': list(last_evaluated_key) if last_evaluated_key is not None else None, 'completed': sorted(list(key) for key in completed)}, f)
+    os.rename(temp_path, path)
+    return
+
+def run(pages, process, key, workers=4, rate_limit=None, checkpoint=None, resume=False, queue_size=None):
+    # pages(start_key) must yield (items, last_evaluated_key) for each page after start_key, where last_evaluated_key is
+    # the start_key that would resume right after that page (None for the last page).  process(item) does the work for
+    # one item and key(item) returns a tuple identifying it.
+    # Items that fail are retried by the next resume; the checkpoint never moves past them.
+    # return format:
+    # {"processed": 480, "skipped": 20, "failed": 0, "seconds": 95.1}
+    if resume and not checkpoint:
+        raise Exception('Must provide a checkpoint file to resume from.')
+    start = time.time()
+    start_key, completed = load_checkpoint(checkpoint) if resume and os.path.exists(checkpoint) else (None, set())
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+    work = queue.Queue(maxsize=queue_size or workers * 2)
+    lock = threading.Lock()
+    # page number -> [items still pending, the page's last_evaluated_key, keys of the page's finished items]
+    open_pages = {}
+    state = {'oldest_page': 0, 'checkpoint_key': start_key, 'processed': 0, 'skipped': 0, 'failed': 0, 'errors': [], 'unsaved': 0, 'saved_at': time.time(), 'snapshots': 0, 'pending': None, 'written': 0}
+    # held while writing the checkpoint file, which happens outside lock so the other workers don't wait on the disk
+    checkpoint_lock = threading.Lock()
+
+    def finish(page_number, item_key):
+        # called with lock held whenever an item of page_number is done, or once per page when it's been fully queued.
+        # Returns what to write to the checkpoint file (see write_checkpoint) if it's due, or None.
+        page = open_pages[page_number]
+        page[0] -= 1
+        if item_key is not None:
+            page[2].append(item_key)
+            completed.add(item_key)
+            state['unsaved'] += 1
+        advanced = False
+        while state['oldest_page'] in open_pages and open_pages[state['oldest_page']][0] == 0:
+            pending, last_evaluated_key, keys = open_pages.pop(state['oldest_page'])
+            completed.difference_update(keys)
+            state['checkpoint_key'] = last_evaluated_key
+            state['oldest_page'] += 1
+            advanced = True
+        if not checkpoint or not (advanced or state['unsaved'] >= CHECKPOINT_EVERY_ITEMS or time.time() - state['saved_at'] >= CHECKPOINT_EVERY_SECONDS):
+            return None
+        state['unsaved'] = 0
+        state['saved_at'] = time.time()
+        state['snapshots'] += 1
+        return (state['snapshots'], state['checkpoint_key'], list(completed))
+
+    def write_checkpoint(snapshot):
+        # The newest snapshot is kept in state['pending'].  Whichever thread gets checkpoint_lock writes it out; a thread
+        # that finds another one already writing just leaves its snapshot for that one, so workers never queue up
+        # behind the disk.  Snapshots are numbered, so an older one never replaces a newer one.
+        if snapshot is None:
+            return
+        with lock:
+            if state['pending'] is None or snapshot[0] > state['pending'][0]:
+                state['pending'] = snapshot
+        while checkpoint_lock.acquire(False):
+            try:
+                with lock:
+                    latest = state['pending']
+                if latest[0] <= state['written']:
+                    return
+                save_checkpoint(checkpoint, latest[1], latest[2])
+                state['written'] = latest[0]
+            finally:
+                checkpoint_lock.release()
+        return
+
+    def worker():
+        while True:
+            task = work.get()
+            if task is None:
+                return
+            page_number, item = task
+            try:
+                if limiter:
+                    limiter.acquire()
+                process(item)
+            except Exception as e:
+                with lock:
+                    state['failed'] += 1
+                    state['errors'].append(e)
+                    # leave the page pending so the checkpoint can't move past this item
+                continue
+            with lock:
+                state['processed'] += 1
+                snapshot = finish(page_number, key(item))
+            write_checkpoint(snapshot)
+
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for page_number, (items, last_evaluated_key) in enumerate(pages(start_key)):
+            with lock:
+                # the extra pending count is released once the whole page has been queued
+                open_pages[page_number] = [len(items) + 1, last_evaluated_key, []]
+            for item in items:
+                if key(item) in completed:
+                    with lock:
+                        state['skipped'] += 1
+                        open_pages[page_number][0] -= 1
+                        open_pages[page_number][2].append(key(item))
+                    continue
+                work.put((page_number, item))
+            with lock:
+                snapshot = finish(page_number, None)
+            write_checkpoint(snapshot)
+    finally:
+        for thread in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        # whatever finished since the last write, in case this run stops here
+        if checkpoint:
+            save_checkpoint(checkpoint, state['checkpoint_key'], completed)
+    if state['failed']:
+        raise Exception('{0} of {1} items could not be processed{2}.  First error: {3}'.format(state['failed'], state['failed'] + state['processed'], '; rerun with resume to retry them' if checkpoint else '', state['errors'][0]))
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return {'processed': state['processed'], 'skipped': state['skipped'], 'failed': 0, 'seconds': time.time() - start}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+# A local daemon that keeps warm DynamoDB/KMS connections and a decrypted-secret cache, and answers get_secret and
+# describe_secrets over a unix domain socket.  Short-lived processes on the same host (cron jobs, CLI calls) can then
+# read secrets without paying for boto's import, connection setup and a KMS Decrypt every time.
+#
+# The wire protocol is one JSON object per line in each direction:
+#   request:  {"operation": "get_secret", "secret_name": "password", "secret_version": null, "region": "us-east-1"}
+#   response: {"ok": true, "result": "Z3Vlc3Q="} or {"ok": false, "error": "No active versions of secret 'foo' found."}
+# Secrets are base64-encoded in responses, as they're bytes and needn't be valid UTF-8.
+#
+# Access control: the socket file is created mode 0600 (0660 if allowed_gids is set), and on Linux every connection's
+# peer credentials are checked against allowed_uids/allowed_gids before any request is answered.
+
+import base64
+import json
+import kaurna
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'kaurna-{0}.sock'.format(os.getuid()))
+
+# This is the Linux value; Python 2's socket module doesn't export the constant.
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+def get_peer_credentials(sock):
+    # returns (pid, uid, gid) of the process on the other end of a unix socket, or None if this platform can't tell us
+    if not sys.platform.startswith('linux'):
+        return None
+    return struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i')))
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        if not self.server.is_authorized(get_peer_credentials(self.request)):
+            self._respond(json.dumps({'ok': False, 'error': 'Permission denied.'}))
+            return
+        # clients may send several requests over one connection
+        for line in iter(self.rfile.readline, b''):
+            if not line.strip():
+                continue
+            # the response is serialized inside the try too, so a result that can't be sent still gets an error back
+            try:
+                response = json.dumps({'ok': True, 'result': self.server.dispatch(json.loads(line.decode('utf-8')))})
+            except Exception as e:
+                response = json.dumps({'ok': False, 'error': str(e)})
+            self._respond(response)
+        return
+
+    def _respond(self, response):
+        self.wfile.write((response + '\n').encode('utf-8'))
+        self.wfile.flush()
+        return
+
+class SecretServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, allowed_uids=None, allowed_gids=None):
+        self.socket_path = socket_path
+        self.allowed_uids = set(allowed_uids) if allowed_uids is not None else set([os.getuid()])
+        self.allowed_gids = set(allowed_gids or [])
+        _remove_stale_socket(socket_path)
+        old_umask = os.umask(0o117 if self.allowed_gids else 0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def is_authorized(self, credentials):
+        if credentials is None:
+            # no peer credentials on this platform, so the socket file's permissions are all we have
+            return True
+        pid, uid, gid = credentials
+        return uid in self.allowed_uids or gid in self.allowed_gids
+
+    def dispatch(self, message):
+        operation = message.get('operation')
+        region = message.get('region') or 'us-east-1'
+        if operation == 'get_secret':
+            secret = kaurna.get_secret(secret_name=message.get('secret_name'), secret_version=message.get('secret_version'), region=region)
+            return base64.b64encode(kaurna._bytes(secret)).decode('ascii')
+        elif operation == 'describe_secrets':
+            return kaurna.describe_secrets(secret_name=message.get('secret_name'), secret_version=message.get('secret_version'), region=region)
+        elif operation == 'ping':
+            return 'pong'
+        raise Exception('Unknown operation \'{0}\'.'.format(operation))
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        return
+
+def _remove_stale_socket(socket_path):
+    # A socket file left behind by a daemon that died is removed, but we refuse to start if something is still
+    # listening on it or if the path is something other than a socket.
+    if not os.path.exists(socket_path):
+        return
+    if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        raise Exception('{0} exists and is not a socket.'.format(socket_path))
+    if SecretClient(socket_path).available():
+        raise Exception('A kaurna daemon is already listening on {0}.'.format(socket_path))
+    os.unlink(socket_path)
+    return
+
+# manually tested
+def serve(socket_path=DEFAULT_SOCKET_PATH, cache_ttl=300, allowed_uids=None, allowed_gids=None, **kwargs):
+    # This method will run the daemon in the foreground until it's interrupted.
+    # refresh ahead of expiry so that clients of a long-running daemon almost never wait on AWS
+    kaurna.enable_secret_cache(ttl=cache_ttl, refresh_ahead=0.8, jitter=0.1)
+    server = SecretServer(socket_path=socket_path, allowed_uids=allowed_uids, allowed_gids=allowed_gids)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return
+
+class SecretClient(object):
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def available(self):
+        # Only talk to a socket owned by us or root, so another user can't plant a fake daemon at the default path.
+        try:
+            info = os.stat(self.socket_path)
+        except OSError:
+            return False
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid not in [os.getuid(), 0]:
+            return False
+        try:
+            return self._call({'operation': 'ping'}) == 'pong'
+        except Exception:
+            return False
+
+    def get_secret(self, secret_name, secret_version=None, region='us-east-1', **kwargs):
+        # decoded back to the bytes kaurna.get_secret returns (str on python 2)
+        return base64.b64decode(self._call({'operation': 'get_secret', 'secret_name': secret_name, 'secret_version': secret_version, 'region': region}))
+
+    def describe_secrets(self, secret_name=None, secret_version=None, region='us-east-1', **kwargs):
+        descriptions = self._call({'operation': 'describe_secrets', 'secret_name': secret_name, 'secret_version': secret_version, 'region': region})
+        # JSON object keys are always strings, so turn the versions back into ints to match kaurna.describe_secrets
+        return dict((name, dict((int(version), description) for version, description in versions.items())) for name, versions in descriptions.items())
+
+    def _call(self, message):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            response = json.loads(sock.makefile('rb').readline().decode('utf-8'))
+        finally:
+            sock.close()
+        if not response['ok']:
+            raise Exception(response['error'])
+        return response['result']
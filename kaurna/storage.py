@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+
+# Storage backends hold kaurna's tables: the secrets themselves, the entity index and the default blob store's chunks.
+# kaurna talks to a table through the part of boto.dynamodb's Table and Item interface it has always used:
+# new_item(...).put(), item.save() and item.delete() (each optionally conditional on expected_value), get_item, query,
+# scan and batch_get_item, plus batch_write.  The DynamoDB backend therefore just hands out boto's own tables, and the
+# local backends (MemoryBackend and SQLiteBackend) implement the same methods, so the rest of kaurna doesn't care which
+# one it's using.  Pick one with kaurna.configure_storage.
+#
+# The local backends keep attributes exactly as DynamoDB would hand them back (booleans come back as 0/1, binary as
+# Binary) and raise the same DynamoDBConditionalCheckFailedError when a condition fails.  They're meant for benchmarks,
+# tests and hosts that can't reach DynamoDB.  A MemoryBackend only lives as long as its process; a SQLite database can
+# be shared by all the processes on a host.
+
+import bisect
+from contextlib import contextmanager
+import json
+import sqlite3
+import threading
+
+from boto.dynamodb.exceptions import DynamoDBConditionalCheckFailedError, DynamoDBKeyNotFoundError
+from boto.dynamodb.types import LossyFloatDynamizer
+from boto.exception import DynamoDBResponseError
+
+# How many items query and scan read at a time when no request_limit is given.
+PAGE_SIZE = 1000
+
+_MISSING = object()
+
+class StorageBackend(object):
+    # The interface.  get_table returns the named table in the given region, creating it with the given key schema if
+    # it doesn't exist yet.  Key types are str or int.
+
+    name = None
+
+    def get_table(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type, region='us-east-1', read_throughput=1, write_throughput=1):
+        raise NotImplementedError()
+
+class DynamoDBBackend(StorageBackend):
+    # The default.  connect(region) returns the (pooled) boto.dynamodb connection for the region.
+
+    name = 'dynamodb'
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def get_table(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type, region='us-east-1', read_throughput=1, write_throughput=1):
+        ddb = self.connect(region)
+        try:
+            # get_table output is a DDB Table object
+            return ddb.get_table(name=name)
+            # If the table doesn't exist, an error will get thrown
+        except DynamoDBResponseError as e:
+            schema = ddb.create_schema(
+                hash_key_name=hash_key_name,
+                hash_key_proto_value=hash_key_type,
+                range_key_name=range_key_name,
+                range_key_proto_value=range_key_type
+                    )
+            # create_table output is a DDB Table object
+            return ddb.create_table(name=name, schema=schema, read_units=read_throughput, write_units=write_throughput)
+
+class MemoryBackend(StorageBackend):
+    # Keeps its tables in this object, so they last as long as it does and aren't shared with other processes.
+
+    name = 'memory'
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def get_table(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type, region='us-east-1', read_throughput=1, write_throughput=1):
+        with self._lock:
+            if (region, name) not in self._tables:
+                self._tables[(region, name)] = MemoryTable(name, hash_key_name, hash_key_type, range_key_name, range_key_type)
+            return self._tables[(region, name)]
+
+class SQLiteBackend(StorageBackend):
+    # Keeps every table in one SQLite database file, one SQL table per region and kaurna table.  The database runs in WAL
+    # mode, so readers in other processes don't block the writer, and each table's primary key is (hash key, range key),
+    # which for the kaurna table means an index on secret name and version.  Conditional writes happen inside a
+    # BEGIN IMMEDIATE transaction, so they're atomic across processes too.
+
+    name = 'sqlite'
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        # one connection, shared by every thread and serialized by the lock
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._tables = {}
+
+    def get_table(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type, region='us-east-1', read_throughput=1, write_throughput=1):
+        with self._lock:
+            if (region, name) not in self._tables:
+                table = SQLiteTable(name, hash_key_name, hash_key_type, range_key_name, range_key_type, connection=self._connection, lock=self._lock, sql_name='{0}/{1}'.format(region, name))
+                table._create()
+                self._tables[(region, name)] = table
+            return self._tables[(region, name)]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+        return
+
+class StoredItem(dict):
+    # The local backends' version of boto's Item: a dict of attributes that remembers which ones have been set, so that
+    # save() only writes those, like an UpdateItem.  As with boto, every attribute other than the key counts as set when
+    # the item is made, whether by new_item or by reading it from the table, so saving an item that was just read
+    # writes all of it back.
+
+    def __init__(self, table, hash_key=None, range_key=None, attrs=None):
+        dict.__init__(self, attrs or {})
+        self.table = table
+        if hash_key is not None:
+            dict.__setitem__(self, table.hash_key_name, hash_key)
+        if range_key is not None:
+            dict.__setitem__(self, table.range_key_name, range_key)
+        self._updates = set(self) - set([table.hash_key_name, table.range_key_name])
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, name, value)
+        self._updates.add(name)
+
+    def put(self, expected_value=None):
+        self.table.put_item(dict(self), expected_value=expected_value)
+        self._updates = set()
+        return True
+
+    def save(self, expected_value=None):
+        self.table.update_item(self.table._item_key(self), dict((name, self[name]) for name in self._updates), expected_value=expected_value)
+        self._updates = set()
+        return
+
+    def delete(self, expected_value=None):
+        self.table.delete_item(self.table._item_key(self), expected_value=expected_value)
+        return
+
+class Results(object):
+    # What the local tables' query and scan return, standing in for boto's TableGenerator.  Iterating yields every
+    # matching item, reading request_limit items (before filtering, as DynamoDB counts them) at a time.  response and
+    # last_evaluated_key describe just the first page, which is how kaurna._entry_pages reads a table a page at a time.
+
+    item_class = StoredItem
+
+    def __init__(self, table, read_page, conditions=None, attributes_to_get=None, request_limit=None, max_results=None, exclusive_start_key=None):
+        self.table = table
+        self._read_page = read_page
+        self._conditions = conditions or {}
+        self._attributes_to_get = attributes_to_get
+        self._request_limit = request_limit or PAGE_SIZE
+        self._max_results = max_results
+        self._exclusive_start_key = table._key(*exclusive_start_key) if exclusive_start_key else None
+        self._response = None
+        self.last_evaluated_key = None
+
+    def _page(self, after, remaining):
+        # returns the matching items of the page after the given key, and the key to continue from (None at the end)
+        limit = min(self._request_limit, remaining) if remaining is not None else self._request_limit
+        rows = self._read_page(after, limit)
+        items = []
+        for key, encoded in rows:
+            attrs = self.table._decode(encoded)
+            if all(_condition_holds(condition, attrs.get(name, _MISSING), self.table._normalize) for name, condition in self._conditions.items()):
+                items.append(attrs if self._attributes_to_get is None else dict((name, attrs[name]) for name in self._attributes_to_get if name in attrs))
+        return items, rows[-1][0] if len(rows) == limit else None
+
+    @property
+    def response(self):
+        if self._response is None:
+            items, self.last_evaluated_key = self._page(self._exclusive_start_key, self._max_results)
+            self._response = {'Items': items, 'Count': len(items)}
+        return self._response
+
+    def __iter__(self):
+        after = self._exclusive_start_key
+        remaining = self._max_results
+        while remaining is None or remaining > 0:
+            items, after = self._page(after, remaining)
+            for attrs in items[:remaining]:
+                yield self.table._loaded_item(attrs)
+            if remaining is not None:
+                remaining -= len(items)
+            if after is None:
+                return
+        return
+
+# The scan and query conditions (see boto.dynamodb.condition) the local tables understand, by class name.
+_COMPARISONS = {
+    'EQ': lambda value, condition, normalize: value == normalize(condition.v1),
+    'NE': lambda value, condition, normalize: value != normalize(condition.v1),
+    'LT': lambda value, condition, normalize: value < normalize(condition.v1),
+    'LE': lambda value, condition, normalize: value <= normalize(condition.v1),
+    'GT': lambda value, condition, normalize: value > normalize(condition.v1),
+    'GE': lambda value, condition, normalize: value >= normalize(condition.v1),
+    'BETWEEN': lambda value, condition, normalize: normalize(condition.v1) <= value <= normalize(condition.v2),
+    'BEGINS_WITH': lambda value, condition, normalize: value.startswith(normalize(condition.v1)),
+    'CONTAINS': lambda value, condition, normalize: normalize(condition.v1) in value,
+    'IN': lambda value, condition, normalize: value in [normalize(v) for v in condition.values],
+    }
+
+def _condition_holds(condition, value, normalize):
+    name = condition.__class__.__name__
+    if name == 'NULL':
+        return value is _MISSING
+    if name == 'NOT_NULL':
+        return value is not _MISSING
+    if name not in _COMPARISONS:
+        raise Exception('The {0} condition isn\'t supported by local storage backends.'.format(name))
+    return value is not _MISSING and _COMPARISONS[name](value, condition, normalize)
+
+class LocalTable(object):
+    # The table interface, implemented on top of a few storage primitives that subclasses provide: _load(key),
+    # _store(key, encoded), _remove(key), _read_keys(hash_key, after, reverse, limit), _drop() and _transaction(), a
+    # context manager inside which reads and writes are atomic.  Keys are (hash key, range key) tuples and items are
+    # stored as dicts of DynamoDB-encoded attribute values.
+
+    def __init__(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type):
+        self.name = name
+        self.hash_key_name = hash_key_name
+        self.hash_key_type = hash_key_type
+        self.range_key_name = range_key_name
+        self.range_key_type = range_key_type
+        self.dynamizer = LossyFloatDynamizer()
+
+    def _key(self, hash_key, range_key):
+        return (hash_key if hash_key is None or self.hash_key_type is not int else int(hash_key), range_key if range_key is None or self.range_key_type is not int else int(range_key))
+
+    def _item_key(self, attrs):
+        return self._key(attrs[self.hash_key_name], attrs[self.range_key_name])
+
+    def _encode(self, attrs):
+        return dict((name, self.dynamizer.encode(value)) for name, value in attrs.items())
+
+    def _decode(self, encoded):
+        return dict((name, self.dynamizer.decode(value)) for name, value in encoded.items())
+
+    def _normalize(self, value):
+        # what value would come back as after a round trip through the table
+        return self.dynamizer.decode(self.dynamizer.encode(value))
+
+    def _loaded_item(self, attrs):
+        return StoredItem(self, attrs=attrs)
+
+    def _check_expected(self, encoded, expected_value):
+        # As in boto: {name: False} means the attribute mustn't exist, {name: True} that it must, and anything else that
+        # it must have that value.
+        for name, value in (expected_value or {}).items():
+            stored = encoded.get(name) if encoded is not None else None
+            if value is False:
+                holds = stored is None
+            elif value is True:
+                holds = stored is not None
+            else:
+                holds = stored is not None and self.dynamizer.decode(stored) == self._normalize(value)
+            if not holds:
+                raise DynamoDBConditionalCheckFailedError(400, 'ConditionalCheckFailedException')
+        return
+
+    def new_item(self, hash_key=None, range_key=None, attrs=None):
+        return StoredItem(self, hash_key=hash_key, range_key=range_key, attrs=attrs)
+
+    def put_item(self, attrs, expected_value=None):
+        key = self._item_key(attrs)
+        with self._transaction():
+            self._check_expected(self._load(key), expected_value)
+            self._store(key, self._encode(attrs))
+        return
+
+    def update_item(self, key, attrs, expected_value=None):
+        # like UpdateItem, this creates the item if it doesn't exist
+        key = self._key(*key)
+        with self._transaction():
+            encoded = self._load(key)
+            self._check_expected(encoded, expected_value)
+            updated = dict(encoded) if encoded is not None else self._encode({self.hash_key_name: key[0], self.range_key_name: key[1]})
+            updated.update(self._encode(attrs))
+            self._store(key, updated)
+        return
+
+    def delete_item(self, key, expected_value=None):
+        key = self._key(*key)
+        with self._transaction():
+            self._check_expected(self._load(key), expected_value)
+            self._remove(key)
+        return
+
+    def batch_write(self, puts=None, deletes=None):
+        # puts are items from new_item, deletes are (hash key, range key) pairs.  The whole batch is one transaction.
+        with self._transaction():
+            for item in puts or []:
+                self._store(self._item_key(item), self._encode(item))
+            for key in deletes or []:
+                self._remove(self._key(*key))
+        return
+
+    def get_item(self, hash_key, range_key=None, attributes_to_get=None):
+        encoded = self._load(self._key(hash_key, range_key))
+        if encoded is None:
+            raise DynamoDBKeyNotFoundError('Key does not exist.')
+        attrs = self._decode(encoded)
+        return self._loaded_item(attrs if attributes_to_get is None else dict((name, attrs[name]) for name in attributes_to_get if name in attrs))
+
+    def batch_get_item(self, keys, attributes_to_get=None):
+        for hash_key, range_key in keys:
+            try:
+                yield self.get_item(hash_key, range_key, attributes_to_get=attributes_to_get)
+            except DynamoDBKeyNotFoundError as e:
+                pass
+        return
+
+    def query(self, hash_key, range_key_condition=None, attributes_to_get=None, request_limit=None, max_results=None, consistent_read=False, scan_index_forward=True, exclusive_start_key=None):
+        # consistent_read is accepted as boto does, but local reads are always consistent
+        hash_key = self._key(hash_key, None)[0]
+        return Results(
+            self,
+            lambda after, limit: self._read_keys(hash_key, after, not scan_index_forward, limit),
+            conditions={self.range_key_name: range_key_condition} if range_key_condition is not None else None,
+            attributes_to_get=attributes_to_get,
+            request_limit=request_limit,
+            max_results=max_results,
+            exclusive_start_key=exclusive_start_key
+            )
+
+    def scan(self, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None, exclusive_start_key=None):
+        return Results(
+            self,
+            lambda after, limit: self._read_keys(None, after, False, limit),
+            conditions=scan_filter,
+            attributes_to_get=attributes_to_get,
+            request_limit=request_limit,
+            max_results=max_results,
+            exclusive_start_key=exclusive_start_key
+            )
+
+    def delete(self):
+        with self._transaction():
+            self._drop()
+        return True
+
+class MemoryTable(LocalTable):
+    # Items in a dict, plus a sorted list of their keys for queries and scans.
+
+    def __init__(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type):
+        LocalTable.__init__(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type)
+        self._items = {}
+        self._keys = []
+        self._lock = threading.RLock()
+
+    def _transaction(self):
+        return self._lock
+
+    def _load(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def _store(self, key, encoded):
+        if key not in self._items:
+            bisect.insort(self._keys, key)
+        self._items[key] = encoded
+        return
+
+    def _remove(self, key):
+        if self._items.pop(key, None) is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+        return
+
+    def _read_keys(self, hash_key, after, reverse, limit):
+        # returns up to limit (key, encoded item) pairs following after, in key order (or reverse key order)
+        with self._lock:
+            if hash_key is None:
+                start = bisect.bisect_right(self._keys, after) if after is not None else 0
+                keys = self._keys[start:start + limit]
+            else:
+                start = end = bisect.bisect_left(self._keys, (hash_key,))
+                while end < len(self._keys) and self._keys[end][0] == hash_key:
+                    end += 1
+                keys = self._keys[start:end][::-1] if reverse else self._keys[start:end]
+                if after is not None:
+                    keys = [key for key in keys if (key < after if reverse else key > after)]
+                keys = keys[:limit]
+            return [(key, self._items[key]) for key in keys]
+
+    def _drop(self):
+        self._items = {}
+        self._keys = []
+        return
+
+class SQLiteTable(LocalTable):
+    # One SQL table with the hash and range keys as its primary key and the rest of the item as JSON.
+
+    def __init__(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type, connection, lock, sql_name):
+        LocalTable.__init__(self, name, hash_key_name, hash_key_type, range_key_name, range_key_type)
+        self._connection = connection
+        self._lock = lock
+        self._sql_name = '"{0}"'.format(sql_name.replace('"', '""'))
+
+    def _create(self):
+        sql_types = {str: 'TEXT', int: 'INTEGER'}
+        with self._lock:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS {0} (hash_key {1} NOT NULL, range_key {2} NOT NULL, attributes TEXT NOT NULL, PRIMARY KEY (hash_key, range_key))'.format(self._sql_name, sql_types[self.hash_key_type], sql_types[self.range_key_type]))
+        return
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so that a conditional write's read and write can't be split by
+            # another process's write
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def _load(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT attributes FROM {0} WHERE hash_key = ? AND range_key = ?'.format(self._sql_name), key).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _store(self, key, encoded):
+        self._connection.execute('INSERT OR REPLACE INTO {0} (hash_key, range_key, attributes) VALUES (?, ?, ?)'.format(self._sql_name), (key[0], key[1], json.dumps(encoded, sort_keys=True)))
+        return
+
+    def _remove(self, key):
+        self._connection.execute('DELETE FROM {0} WHERE hash_key = ? AND range_key = ?'.format(self._sql_name), key)
+        return
+
+    def _read_keys(self, hash_key, after, reverse, limit):
+        if hash_key is None:
+            where, parameters = ('WHERE hash_key > ? OR (hash_key = ? AND range_key > ?)', [after[0], after[0], after[1]]) if after is not None else ('', [])
+            order = 'ORDER BY hash_key, range_key'
+        else:
+            where, parameters = 'WHERE hash_key = ?', [hash_key]
+            if after is not None:
+                where += ' AND range_key {0} ?'.format('<' if reverse else '>')
+                parameters.append(after[1])
+            order = 'ORDER BY range_key DESC' if reverse else 'ORDER BY range_key'
+        with self._lock:
+            rows = self._connection.execute('SELECT hash_key, range_key, attributes FROM {0} {1} {2} LIMIT ?'.format(self._sql_name, where, order), parameters + [limit]).fetchall()
+        return [(self._key(hash_key, range_key), json.loads(attributes)) for hash_key, range_key, attributes in rows]
+
+    def _drop(self):
+        # emptied rather than dropped, so that the backend's handle on the table stays good
+        self._connection.execute('DELETE FROM {0}'.format(self._sql_name))
+        return
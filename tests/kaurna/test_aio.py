@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import sys
+from nose.plugins.skip import SkipTest
+
+if sys.version_info < (3, 5):
+    raise SkipTest('kaurna.aio requires Python 3.5 or later')
+
+import asyncio
+import kaurna.aio
+from mock import call, MagicMock, patch
+from nose.tools import assert_equals
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+class KaurnaAioTests(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.region = 'us-west-1'
+
+    def tearDown(self):
+        patch.stopall()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        kaurna.aio.configure()
+
+    def test_GIVEN_max_in_flight_WHEN_many_get_secret_calls_made_THEN_concurrency_limited(self):
+        # GIVEN
+        kaurna.aio.configure(max_in_flight=2)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+        def slow_get_secret(secret_name, secret_version=None, region='us-east-1'):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+            return secret_name.upper()
+        patch('kaurna.get_secret', slow_get_secret).start()
+
+        # WHEN
+        names = ['a', 'b', 'c', 'd', 'e', 'f']
+        secrets = self.loop.run_until_complete(asyncio.gather(*[kaurna.aio.get_secret(name, region=self.region) for name in names]))
+
+        # THEN
+        assert_equals(['A', 'B', 'C', 'D', 'E', 'F'], secrets)
+        assert_equals(2, state['peak'])
+
+    def test_WHEN_store_secret_called_THEN_synchronous_store_secret_called(self):
+        # GIVEN
+        mock_store_secret = MagicMock(return_value=None)
+        patch('kaurna.store_secret', mock_store_secret).start()
+
+        # WHEN
+        self.loop.run_until_complete(kaurna.aio.store_secret('password', 'guest', authorized_entities=['Sterling Archer'], region=self.region))
+
+        # THEN
+        assert_equals(
+            mock_store_secret.call_args_list,
+            [call(secret_name='password', secret='guest', secret_version=None, authorized_entities=['Sterling Archer'], region=self.region)]
+            )
+
+    def test_GIVEN_local_storage_and_keys_WHEN_secrets_stored_and_read_THEN_they_round_trip_as_bytes(self):
+        # GIVEN
+        directory = tempfile.mkdtemp()
+        try:
+            kaurna.configure_storage('memory')
+            kaurna.configure_key_provider('local:' + os.path.join(directory, 'master.key'))
+
+            # WHEN
+            self.loop.run_until_complete(kaurna.aio.store_secret('password', 'guest', region=self.region))
+            self.loop.run_until_complete(kaurna.aio.store_secret('password', b'\xff\x00guest', region=self.region))
+            secrets = self.loop.run_until_complete(kaurna.aio.get_secrets(['password', ('password', 1)], region=self.region))
+        finally:
+            kaurna.configure_key_provider('kms')
+            kaurna.configure_storage('dynamodb')
+            shutil.rmtree(directory)
+
+        # THEN
+        assert_equals({'password': b'\xff\x00guest', ('password', 1): b'guest'}, secrets)
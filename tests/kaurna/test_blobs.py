@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from kaurna.blobs import DynamoDBBlobStore, LocalBlobStore
+from mock import call, MagicMock
+from nose.tools import assert_equals, raises
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase
+
+class KaurnaBlobTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_GIVEN_chunks_put_WHEN_local_read_called_THEN_chunks_returned_in_order_from_private_files(self):
+        # GIVEN
+        store = LocalBlobStore(self.directory)
+        for index, data in enumerate([b'first', b'second', b'third']):
+            store.put('abc123', index, data)
+
+        # WHEN
+        chunks = list(store.read('abc123', 3))
+
+        # THEN
+        assert_equals([b'first', b'second', b'third'], chunks)
+        assert_equals(['00000000', '00000001', '00000002'], sorted(os.listdir(os.path.join(self.directory, 'abc123'))))
+        assert_equals(0o600, stat.S_IMODE(os.stat(os.path.join(self.directory, 'abc123', '00000000')).st_mode))
+
+    def test_GIVEN_chunk_missing_WHEN_local_read_called_THEN_read_stops_at_missing_chunk(self):
+        # GIVEN
+        store = LocalBlobStore(self.directory)
+        store.put('abc123', 0, b'first')
+        store.put('abc123', 2, b'third')
+
+        # WHEN
+        chunks = list(store.read('abc123', 3))
+
+        # THEN
+        assert_equals([b'first'], chunks)
+
+    def test_GIVEN_partly_written_blob_WHEN_local_delete_called_THEN_blob_removed(self):
+        # GIVEN
+        store = LocalBlobStore(self.directory)
+        store.put('abc123', 0, b'first')
+
+        # WHEN
+        store.delete('abc123', 4)
+        store.delete('never_written', 2)
+
+        # THEN
+        assert_equals([], os.listdir(self.directory))
+
+    @raises(Exception)
+    def test_GIVEN_blob_key_with_path_separator_WHEN_local_put_called_THEN_error_thrown(self):
+        LocalBlobStore(self.directory).put('../etc', 0, b'data')
+
+    def test_GIVEN_chunk_items_WHEN_dynamodb_read_called_THEN_only_consecutive_chunks_up_to_count_returned(self):
+        # GIVEN
+        table = MagicMock()
+        table.query.return_value = [{'chunk': 0, 'data': MagicMock(value=b'first')}, {'chunk': 1, 'data': MagicMock(value=b'second')}, {'chunk': 2, 'data': MagicMock(value=b'leftover')}]
+        store = DynamoDBBlobStore(table)
+
+        # WHEN
+        chunks = list(store.read('abc123', 2))
+
+        # THEN
+        assert_equals([b'first', b'second'], chunks)
+        assert_equals([call(hash_key='abc123')], table.query.call_args_list)
+
+    def test_WHEN_dynamodb_put_and_delete_called_THEN_one_item_per_chunk_written_and_deleted(self):
+        # GIVEN
+        table = MagicMock()
+        store = DynamoDBBlobStore(table)
+
+        # WHEN
+        store.put('abc123', 0, b'first')
+        store.delete('abc123', 2)
+
+        # THEN
+        assert_equals(
+            [c[1]['hash_key'] + '/' + str(c[1]['range_key']) for c in table.new_item.call_args_list],
+            ['abc123/0', 'abc123/0', 'abc123/1']
+            )
+        assert_equals(b'first', table.new_item.call_args_list[0][1]['attrs']['data'].value)
+        assert_equals(1, table.new_item.return_value.put.call_count)
+        assert_equals(2, table.new_item.return_value.delete.call_count)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+from kaurna.cache import LRUCache, MISSING, RefreshingCache
+from mock import MagicMock, patch
+from nose.tools import assert_equals
+import threading
+import time
+from unittest import TestCase
+
+class KaurnaCacheTests(TestCase):
+
+    def setUp(self):
+        self.clock = MagicMock(return_value=1000.0)
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_GIVEN_key_cached_WHEN_get_called_THEN_value_returned_and_hit_counted(self):
+        # GIVEN
+        cache = LRUCache(ttl=60, clock=self.clock)
+        cache.put('password', 'guest', size=5)
+
+        # WHEN
+        value = cache.get('password')
+        missing = cache.get('private_key', MISSING)
+
+        # THEN
+        assert_equals('guest', value)
+        assert_equals(MISSING, missing)
+        assert_equals(1, cache.stats()['hits'])
+        assert_equals(1, cache.stats()['misses'])
+
+    def test_GIVEN_ttl_passed_WHEN_get_called_THEN_entry_expired(self):
+        # GIVEN
+        cache = LRUCache(ttl=60, clock=self.clock)
+        cache.put('password', 'guest', size=5)
+        self.clock.return_value = 1060.0
+
+        # WHEN
+        value = cache.get('password', MISSING)
+
+        # THEN
+        assert_equals(MISSING, value)
+        assert_equals(1, cache.stats()['expirations'])
+        assert_equals(0, cache.stats()['bytes'])
+
+    def test_GIVEN_max_entries_reached_WHEN_put_called_THEN_least_recently_used_entry_evicted(self):
+        # GIVEN
+        cache = LRUCache(max_entries=2, clock=self.clock)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+
+        # WHEN
+        cache.put('c', 3)
+
+        # THEN
+        assert_equals(1, cache.get('a'))
+        assert_equals(None, cache.get('b'))
+        assert_equals(3, cache.get('c'))
+        assert_equals(1, cache.stats()['evictions'])
+
+    def test_GIVEN_max_bytes_reached_WHEN_put_called_THEN_entries_evicted_until_under_budget(self):
+        # GIVEN
+        cache = LRUCache(max_bytes=10, clock=self.clock)
+        cache.put('a', 'aaaa', size=4)
+        cache.put('b', 'bbbb', size=4)
+
+        # WHEN
+        cache.put('c', 'cccccc', size=6)
+        stored = cache.put('d', 'd' * 11, size=11)
+
+        # THEN
+        assert_equals(False, stored)
+        assert_equals(['b', 'c'], sorted(key for key in ['a', 'b', 'c', 'd'] if key in cache))
+        assert_equals(10, cache.stats()['bytes'])
+
+    def test_WHEN_invalidate_matching_called_THEN_only_matching_entries_removed(self):
+        # GIVEN
+        cache = LRUCache(clock=self.clock)
+        cache.put(('us-east-1', 'password', 'latest'), 'guest')
+        cache.put(('us-east-1', 'password', 2), 'guest')
+        cache.put(('us-east-1', 'private_key', 'latest'), 'pem')
+
+        # WHEN
+        removed = cache.invalidate_matching(lambda key: key[1] == 'password')
+
+        # THEN
+        assert_equals(2, removed)
+        assert_equals(1, len(cache))
+        assert_equals('pem', cache.get(('us-east-1', 'private_key', 'latest')))
+
+    def test_GIVEN_max_uses_set_WHEN_entry_used_max_uses_times_THEN_entry_removed(self):
+        # GIVEN
+        cache = LRUCache(max_uses=2, clock=self.clock)
+        cache.put('data_key', 'plaintext')
+
+        # WHEN
+        first = cache.get('data_key')
+        second = cache.get('data_key')
+        third = cache.get('data_key', MISSING)
+
+        # THEN
+        assert_equals('plaintext', first)
+        assert_equals('plaintext', second)
+        assert_equals(MISSING, third)
+        assert_equals(1, cache.stats()['exhausted'])
+
+    def test_GIVEN_max_uses_set_WHEN_entry_put_with_uses_THEN_those_uses_count(self):
+        # GIVEN
+        cache = LRUCache(max_uses=2, clock=self.clock)
+
+        # WHEN
+        stored_used_once = cache.put('data_key', 'plaintext', uses=1)
+        first = cache.get('data_key')
+        second = cache.get('data_key', MISSING)
+        stored_used_up = cache.put('other_data_key', 'plaintext', uses=2)
+
+        # THEN
+        assert_equals((True, False), (stored_used_once, stored_used_up))
+        assert_equals(('plaintext', MISSING), (first, second))
+        assert_equals(0, len(cache))
+        assert_equals(2, cache.stats()['exhausted'])
+
+    def test_GIVEN_concurrent_misses_WHEN_get_or_load_called_THEN_loader_called_once(self):
+        # GIVEN
+        cache = LRUCache(ttl=60)
+        calls = []
+        def slow_loader():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'guest'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('password', slow_loader))) for i in range(5)]
+
+        # WHEN
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # THEN
+        assert_equals(['guest'] * 5, results)
+        assert_equals(1, len(calls))
+        assert_equals(4, cache.stats()['coalesced'])
+
+    def test_GIVEN_invalidated_during_load_WHEN_load_finishes_THEN_result_not_cached(self):
+        # GIVEN
+        cache = LRUCache(ttl=60, clock=self.clock)
+        def loader():
+            cache.invalidate('password')
+            return 'old guest'
+
+        # WHEN
+        value = cache.get_or_load('password', loader)
+
+        # THEN
+        assert_equals('old guest', value)
+        assert_equals(False, 'password' in cache)
+
+    def test_GIVEN_jitter_WHEN_put_called_THEN_ttl_shortened_by_random_fraction(self):
+        # GIVEN
+        patch('kaurna.cache.random.uniform', MagicMock(return_value=0.25)).start()
+        cache = LRUCache(ttl=100, jitter=0.5, clock=self.clock)
+        cache.put('password', 'guest')
+
+        # WHEN
+        self.clock.return_value = 1074.0
+        before_expiry = cache.get('password', MISSING)
+        self.clock.return_value = 1075.0
+        after_expiry = cache.get('password', MISSING)
+
+        # THEN
+        assert_equals('guest', before_expiry)
+        assert_equals(MISSING, after_expiry)
+
+    def test_GIVEN_entry_past_refresh_point_WHEN_get_or_load_called_THEN_stale_value_served_and_refreshed_in_background(self):
+        # GIVEN
+        cache = RefreshingCache(ttl=100, refresh_ahead=0.5, clock=self.clock)
+        loader = MagicMock(side_effect=['guest', 'new guest'])
+        cache.get_or_load('password', loader)
+        self.clock.return_value = 1060.0
+
+        # WHEN
+        stale_value = cache.get_or_load('password', loader)
+        cache.wait_for_refreshes()
+        fresh_value = cache.get_or_load('password', loader)
+
+        # THEN
+        assert_equals('guest', stale_value)
+        assert_equals('new guest', fresh_value)
+        assert_equals(2, loader.call_count)
+        assert_equals(1, cache.stats()['refreshes'])
+        cache.close()
+
+    def test_GIVEN_refresh_fails_WHEN_get_or_load_called_THEN_old_value_served_until_expiry(self):
+        # GIVEN
+        cache = RefreshingCache(ttl=100, refresh_ahead=0.5, clock=self.clock)
+        loader = MagicMock(side_effect=['guest', Exception('KMS is throttling'), 'new guest'])
+        cache.get_or_load('password', loader)
+        self.clock.return_value = 1060.0
+
+        # WHEN
+        stale_value = cache.get_or_load('password', loader)
+        cache.wait_for_refreshes()
+        still_stale_value = cache.get_or_load('password', loader)
+        cache.wait_for_refreshes()
+
+        # THEN
+        assert_equals('guest', stale_value)
+        assert_equals('guest', still_stale_value)
+        assert_equals(1, cache.stats()['refresh_failures'])
+        cache.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+from boto.exception import JSONResponseError
+from boto.kms.exceptions import InvalidCiphertextException, NotFoundException
+import kaurna
+from kaurna.keys import LocalKeyProvider
+from mock import call, MagicMock, patch
+from nose.tools import assert_equals, raises
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase
+
+class KaurnaKeyProviderTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.master_key_file = os.path.join(self.directory, 'master.key')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_GIVEN_no_master_key_file_WHEN_data_key_generated_THEN_key_file_created_and_reused_by_other_providers(self):
+        # GIVEN
+        provider = LocalKeyProvider(self.master_key_file)
+
+        # WHEN
+        data_key = provider.generate_data_key(key_id='alias/kaurna', encryption_context={'Sterling Archer': 'kaurna'}, key_spec='AES_256')
+        decrypted = LocalKeyProvider(self.master_key_file).decrypt(ciphertext_blob=data_key['CiphertextBlob'], encryption_context={'Sterling Archer': 'kaurna'})
+
+        # THEN
+        assert_equals(32, len(data_key['Plaintext']))
+        assert_equals(data_key['Plaintext'], decrypted['Plaintext'])
+        assert_equals(provider.key_id, decrypted['KeyId'])
+        assert_equals(0o600, stat.S_IMODE(os.stat(self.master_key_file).st_mode))
+
+    @raises(InvalidCiphertextException)
+    def test_GIVEN_data_key_WHEN_decrypted_with_different_encryption_context_THEN_error_thrown(self):
+        # GIVEN
+        provider = LocalKeyProvider(self.master_key_file)
+        data_key = provider.generate_data_key(key_id='alias/kaurna', encryption_context={'Sterling Archer': 'kaurna'}, key_spec='AES_256')
+
+        # WHEN
+        provider.decrypt(ciphertext_blob=data_key['CiphertextBlob'], encryption_context={'Cyril Figgis': 'kaurna'})
+
+    @raises(InvalidCiphertextException)
+    def test_GIVEN_data_key_from_another_master_key_WHEN_decrypted_THEN_error_thrown(self):
+        # GIVEN
+        data_key = LocalKeyProvider(os.path.join(self.directory, 'other.key')).generate_data_key(key_id='alias/kaurna', key_spec='AES_256')
+
+        # WHEN
+        LocalKeyProvider(self.master_key_file).decrypt(ciphertext_blob=data_key['CiphertextBlob'])
+
+    def test_GIVEN_data_key_WHEN_re_encrypt_called_THEN_key_only_decrypts_under_new_context(self):
+        # GIVEN
+        provider = LocalKeyProvider(self.master_key_file)
+        data_key = provider.generate_data_key(key_id='alias/kaurna', encryption_context={'Sterling Archer': 'kaurna'}, key_spec='AES_128')
+
+        # WHEN
+        rewrapped = provider.re_encrypt(ciphertext_blob=data_key['CiphertextBlob'], destination_key_id='alias/kaurna', source_encryption_context={'Sterling Archer': 'kaurna'}, destination_encryption_context={'Cyril Figgis': 'kaurna'})
+
+        # THEN
+        assert_equals(16, len(data_key['Plaintext']))
+        assert_equals(data_key['Plaintext'], provider.decrypt(ciphertext_blob=rewrapped['CiphertextBlob'], encryption_context={'Cyril Figgis': 'kaurna'})['Plaintext'])
+        try:
+            provider.decrypt(ciphertext_blob=rewrapped['CiphertextBlob'], encryption_context={'Sterling Archer': 'kaurna'})
+            raise AssertionError('decrypt should have failed')
+        except InvalidCiphertextException as e:
+            pass
+
+    @raises(NotFoundException)
+    def test_WHEN_encrypt_called_with_unknown_key_THEN_error_thrown(self):
+        LocalKeyProvider(self.master_key_file).encrypt(key_id='alias/not-kaurna', plaintext=b'secret')
+
+    def test_GIVEN_rate_limit_WHEN_calls_exceed_it_THEN_extra_calls_throttled_after_injected_latency(self):
+        # GIVEN
+        clock = MagicMock(return_value=100.0)
+        sleep = MagicMock()
+        provider = LocalKeyProvider(self.master_key_file, latency=0.02, max_requests_per_second=2, clock=clock, sleep=sleep)
+        ciphertext_blob = provider.encrypt(key_id='alias/kaurna', plaintext=b'secret')['CiphertextBlob']
+
+        # WHEN
+        provider.decrypt(ciphertext_blob=ciphertext_blob)
+        try:
+            provider.decrypt(ciphertext_blob=ciphertext_blob)
+            raise AssertionError('decrypt should have been throttled')
+        except JSONResponseError as e:
+            error_code = e.error_code
+        clock.return_value = 100.5
+        plaintext = provider.decrypt(ciphertext_blob=ciphertext_blob)['Plaintext']
+
+        # THEN
+        assert_equals('ThrottlingException', error_code)
+        assert_equals(b'secret', plaintext)
+        assert_equals([call(0.02)] * 4, sleep.call_args_list)
+        assert_equals({'generate_data_key': 0, 'encrypt': 1, 'decrypt': 3, 're_encrypt': 0, 'throttled': 1}, provider.stats())
+
+class ConfiguredKeyProviderTests(TestCase):
+
+    def setUp(self):
+        kaurna.reset_clients()
+        kaurna.disable_secret_cache()
+        kaurna.disable_data_key_cache()
+        self.directory = tempfile.mkdtemp()
+        self.mock_connect_kms = patch('kaurna.boto.kms.connect_to_region').start()
+        self.region = 'us-west-1'
+
+    def tearDown(self):
+        patch.stopall()
+        kaurna.configure_key_provider('kms')
+        kaurna.configure_storage('dynamodb')
+        shutil.rmtree(self.directory)
+
+    def test_GIVEN_local_key_provider_configured_WHEN_secrets_stored_and_read_THEN_kms_never_used(self):
+        # GIVEN
+        kaurna.configure_storage('memory')
+        provider = kaurna.configure_key_provider('local:' + os.path.join(self.directory, 'master.key'))
+
+        # WHEN
+        kaurna.store_secret(secret_name='password', secret='guest', authorized_entities=['Sterling Archer'], region=self.region)
+        kaurna.store_secret(secret_name='api_key', secret='swordfish', region=self.region)
+        secret = kaurna.get_secret(secret_name='password', region=self.region)
+        secrets = kaurna.get_secrets(['password', ('api_key', 1)], region=self.region)
+
+        # THEN
+        assert_equals(b'guest', secret)
+        assert_equals({'password': b'guest', ('api_key', 1): b'swordfish'}, secrets)
+        assert_equals(3, provider.stats()['decrypt'])
+        assert_equals(0, self.mock_connect_kms.call_count)
+
+    @raises(Exception)
+    def test_WHEN_configure_key_provider_called_with_unknown_provider_THEN_error_thrown(self):
+        kaurna.configure_key_provider('vault')
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import json
+from kaurna.rotation import load_checkpoint, RateLimiter, run, save_checkpoint
+from mock import MagicMock, patch
+from nose.tools import assert_equals, raises
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+class KaurnaRotationTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'rotation.json')
+        # three pages of items, identified by (secret_name, secret_version)
+        self.table = [
+            ([('a', 1), ('a', 2)], ('a', 2)),
+            ([('b', 1), ('c', 1)], ('c', 1)),
+            ([('d', 1)], None)
+            ]
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.directory)
+
+    def pages(self, start_key):
+        started = start_key is None
+        for items, last_evaluated_key in self.table:
+            if started:
+                yield items, last_evaluated_key
+            started = started or last_evaluated_key == start_key
+
+    def test_GIVEN_several_workers_WHEN_run_called_THEN_every_item_processed_once(self):
+        # GIVEN
+        processed = []
+        lock = threading.Lock()
+        def process(item):
+            with lock:
+                processed.append(item)
+
+        # WHEN
+        summary = run(self.pages, process, key=lambda item: item, workers=3, checkpoint=self.checkpoint)
+
+        # THEN
+        assert_equals(sorted(processed), [('a', 1), ('a', 2), ('b', 1), ('c', 1), ('d', 1)])
+        assert_equals(5, summary['processed'])
+        assert_equals(False, os.path.exists(self.checkpoint))
+
+    def test_GIVEN_item_fails_WHEN_run_resumed_THEN_only_unfinished_items_processed(self):
+        # GIVEN
+        failing = MagicMock(side_effect=lambda item: item == ('c', 1) and fail())
+        def fail():
+            raise Exception('KMS is throttling')
+        try:
+            run(self.pages, failing, key=lambda item: item, workers=1, checkpoint=self.checkpoint)
+        except Exception:
+            pass
+        process = MagicMock()
+
+        # WHEN
+        checkpoint = load_checkpoint(self.checkpoint)
+        summary = run(self.pages, process, key=lambda item: item, workers=1, checkpoint=self.checkpoint, resume=True)
+
+        # THEN
+        assert_equals((('a', 2), set([('b', 1), ('d', 1)])), (checkpoint[0], set(tuple(key) for key in checkpoint[1])))
+        assert_equals(sorted(c[0][0] for c in process.call_args_list), [('c', 1)])
+        assert_equals(2, summary['skipped'])
+
+    def test_GIVEN_oldest_page_stuck_on_failed_item_WHEN_run_called_THEN_checkpoint_only_written_every_few_items(self):
+        # GIVEN
+        self.table = [([('a', version) for version in range(1, 8)], None)]
+        patch('kaurna.rotation.CHECKPOINT_EVERY_ITEMS', 2).start()
+        patch('kaurna.rotation.CHECKPOINT_EVERY_SECONDS', 3600).start()
+        mock_save_checkpoint = patch('kaurna.rotation.save_checkpoint', MagicMock(side_effect=save_checkpoint)).start()
+        def process(item):
+            if item == ('a', 1):
+                raise Exception('KMS is throttling')
+
+        # WHEN
+        try:
+            run(self.pages, process, key=lambda item: item, workers=1, checkpoint=self.checkpoint)
+            raise AssertionError('run should have failed')
+        except Exception as e:
+            pass
+
+        # THEN
+        # after the 2nd, 4th and 6th finished items, and once more at the end
+        assert_equals([2, 4, 6, 6], [len(c[0][2]) for c in mock_save_checkpoint.call_args_list])
+        assert_equals((None, set(('a', version) for version in range(2, 8))), load_checkpoint(self.checkpoint))
+
+    @raises(Exception)
+    def test_GIVEN_resume_without_checkpoint_WHEN_run_called_THEN_error_thrown(self):
+        # WHEN
+        run(self.pages, MagicMock(), key=lambda item: item, resume=True)
+
+        # THEN
+        # Exception should get thrown and we should never get here
+
+    def test_GIVEN_rate_limit_WHEN_acquire_called_repeatedly_THEN_calls_spaced_out(self):
+        # GIVEN
+        clock = MagicMock(return_value=100.0)
+        sleep = MagicMock()
+        limiter = RateLimiter(4, clock=clock, sleep=sleep)
+
+        # WHEN
+        for i in range(3):
+            limiter.acquire()
+
+        # THEN
+        assert_equals([c[0][0] for c in sleep.call_args_list], [0.25, 0.5])
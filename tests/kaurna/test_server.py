@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import kaurna
+from kaurna.server import SecretClient, SecretServer
+from mock import call, MagicMock, patch
+from nose.tools import assert_equals, raises
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+class KaurnaServerTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'kaurna.sock')
+        self.server = None
+
+    def tearDown(self):
+        patch.stopall()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def start_server(self, **kwargs):
+        self.server = SecretServer(socket_path=self.socket_path, **kwargs)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def test_GIVEN_daemon_running_WHEN_get_secret_called_THEN_secret_served_by_daemon(self):
+        # GIVEN
+        mock_get_secret = MagicMock(return_value=b'guest')
+        patch('kaurna.get_secret', mock_get_secret).start()
+        self.start_server()
+        client = SecretClient(self.socket_path)
+
+        # WHEN
+        available = client.available()
+        secret = client.get_secret('password', secret_version=2, region='us-west-1')
+
+        # THEN
+        assert_equals(True, available)
+        assert_equals(b'guest', secret)
+        assert_equals(
+            mock_get_secret.call_args_list,
+            [call(secret_name='password', secret_version=2, region='us-west-1')]
+            )
+        assert_equals(0o600, os.stat(self.socket_path).st_mode & 0o777)
+
+    def test_GIVEN_secret_not_valid_utf8_WHEN_get_secret_called_THEN_same_bytes_returned(self):
+        # GIVEN
+        patch('kaurna.get_secret', MagicMock(return_value=b'\xff\xfe\x00guest')).start()
+        self.start_server()
+
+        # WHEN
+        secret = SecretClient(self.socket_path).get_secret('password')
+
+        # THEN
+        assert_equals(b'\xff\xfe\x00guest', secret)
+
+    def test_GIVEN_result_cannot_be_serialized_WHEN_called_THEN_error_raised_by_client_and_daemon_keeps_serving(self):
+        # GIVEN
+        patch('kaurna.describe_secrets', MagicMock(side_effect=[{'password': {2: object()}}, {}])).start()
+        self.start_server()
+        client = SecretClient(self.socket_path)
+
+        # WHEN
+        try:
+            client.describe_secrets(secret_name='password')
+            raise AssertionError('describe_secrets should have failed')
+        except Exception as e:
+            error = str(e)
+
+        # THEN
+        assert 'not JSON serializable' in error, error
+        assert_equals({}, client.describe_secrets(secret_name='password'))
+
+    def test_GIVEN_daemon_running_WHEN_describe_secrets_called_THEN_versions_returned_as_ints(self):
+        # GIVEN
+        descriptions = {'password': {2: {'create_date': 2300, 'last_data_key_rotation': 2300, 'authorized_entities': ['Sterling Archer'], 'deprecated': False}}}
+        patch('kaurna.describe_secrets', MagicMock(return_value=descriptions)).start()
+        self.start_server()
+
+        # WHEN
+        actual_descriptions = SecretClient(self.socket_path).describe_secrets(secret_name='password')
+
+        # THEN
+        assert_equals(descriptions, actual_descriptions)
+
+    @raises(Exception)
+    def test_GIVEN_secret_missing_WHEN_get_secret_called_THEN_error_raised_by_client(self):
+        # GIVEN
+        patch('kaurna.get_secret', MagicMock(side_effect=Exception('No active versions of secret \'password\' found.'))).start()
+        self.start_server()
+
+        # WHEN
+        SecretClient(self.socket_path).get_secret('password')
+
+        # THEN
+        # Exception should get thrown and we should never get here
+
+    def test_GIVEN_caller_uid_not_allowed_WHEN_get_secret_called_THEN_request_refused(self):
+        # GIVEN
+        mock_get_secret = MagicMock(return_value='guest')
+        patch('kaurna.get_secret', mock_get_secret).start()
+        self.start_server(allowed_uids=[])
+        client = SecretClient(self.socket_path)
+
+        # WHEN
+        available = client.available()
+
+        # THEN
+        assert_equals(False, available)
+        assert_equals(mock_get_secret.call_args_list, [])
+
+    def test_GIVEN_no_daemon_WHEN_available_called_THEN_false(self):
+        assert_equals(False, SecretClient(self.socket_path).available())
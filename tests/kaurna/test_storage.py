@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+
+from boto.dynamodb.condition import BEGINS_WITH, EQ, LT
+from boto.dynamodb.exceptions import DynamoDBConditionalCheckFailedError
+from boto.dynamodb.types import Binary
+import io
+import kaurna
+from kaurna.storage import LocalTable, MemoryBackend, SQLiteBackend
+from mock import MagicMock, patch
+from nose.tools import assert_equals, raises
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+class BackendTests(object):
+    # Run against every local backend by the TestCases below, which provide make_backend.
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = self.make_backend()
+        self.table = self.backend.get_table(name='kaurna', hash_key_name='secret_name', hash_key_type=str, range_key_name='secret_version', range_key_type=int, region='us-west-1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _put_versions(self, secret_name, versions, **attrs):
+        for version in versions:
+            item_attrs = dict(attrs, secret_name=secret_name, secret_version=version, last_data_key_rotation=version * 100)
+            self.table.new_item(attrs=item_attrs).put()
+
+    def test_GIVEN_item_put_WHEN_get_item_called_THEN_attributes_come_back_as_dynamodb_would_return_them(self):
+        # GIVEN
+        self.table.new_item(attrs={'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': Binary(b'\x02secret'), 'deprecated': False, 'secret_size': 5}).put()
+
+        # WHEN
+        item = self.table.get_item(hash_key='password', range_key=1)
+
+        # THEN
+        assert_equals({'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': Binary(b'\x02secret'), 'deprecated': 0, 'secret_size': 5}, dict(item))
+        assert_equals(b'\x02secret', item['encrypted_secret'].value)
+
+    @raises(DynamoDBConditionalCheckFailedError)
+    def test_GIVEN_version_exists_WHEN_conditional_put_called_THEN_check_fails(self):
+        # GIVEN
+        self.table.new_item(attrs={'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': 'old'}).put(expected_value={'secret_version': False})
+
+        # WHEN
+        self.table.new_item(attrs={'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': 'new'}).put(expected_value={'secret_version': False})
+
+    def test_GIVEN_two_copies_of_item_WHEN_each_saves_a_different_attribute_THEN_every_loaded_attribute_written_as_boto_does(self):
+        # GIVEN
+        self._put_versions('password', [1], deprecated=False, authorized_entities='[]')
+        first = list(self.table.query(hash_key='password'))[0]
+        second = list(self.table.query(hash_key='password'))[0]
+
+        # WHEN
+        first['deprecated'] = True
+        first.save(expected_value={'deprecated': 0})
+        second['authorized_entities'] = '["Sterling Archer"]'
+        second.save()
+
+        # THEN
+        # second wrote back the deprecated it read, undoing first's change, just as a boto Item would
+        item = self.table.get_item(hash_key='password', range_key=1)
+        assert_equals((0, '["Sterling Archer"]'), (item['deprecated'], item['authorized_entities']))
+
+    def test_GIVEN_item_put_WHEN_read_back_THEN_every_attribute_but_the_key_counts_as_set_as_with_boto(self):
+        # GIVEN
+        self._put_versions('password', [1], deprecated=False, authorized_entities='[]')
+
+        # WHEN
+        queried = list(self.table.query(hash_key='password'))[0]
+        got = self.table.get_item(hash_key='password', range_key=1)
+
+        # THEN
+        assert_equals(set(['deprecated', 'authorized_entities', 'last_data_key_rotation']), queried._updates)
+        assert_equals(set(['deprecated', 'authorized_entities', 'last_data_key_rotation']), got._updates)
+
+    def test_GIVEN_attribute_changed_since_read_WHEN_conditional_save_called_THEN_check_fails_and_nothing_written(self):
+        # GIVEN
+        self._put_versions('password', [1], deprecated=False)
+        item = list(self.table.query(hash_key='password'))[0]
+        self.table.get_item(hash_key='password', range_key=1).save()
+        other = self.table.get_item(hash_key='password', range_key=1)
+        other['deprecated'] = True
+        other.save()
+
+        # WHEN
+        item['deprecated'] = False
+        item['last_data_key_rotation'] = 12345
+        try:
+            item.save(expected_value={'deprecated': 0})
+            raise AssertionError('save should have failed')
+        except DynamoDBConditionalCheckFailedError as e:
+            pass
+
+        # THEN
+        assert_equals((1, 100), (self.table.get_item(hash_key='password', range_key=1)['deprecated'], self.table.get_item(hash_key='password', range_key=1)['last_data_key_rotation']))
+
+    def test_GIVEN_several_versions_WHEN_query_called_THEN_versions_come_back_in_order_with_requested_attributes(self):
+        # GIVEN
+        self._put_versions('password', [1, 2, 10, 3], encrypted_secret='secret')
+        self._put_versions('passwords', [1], encrypted_secret='secret')
+
+        # WHEN
+        newest = [dict(item) for item in self.table.query(hash_key='password', attributes_to_get=['secret_version'], max_results=1, scan_index_forward=False)]
+        paged = [item['secret_version'] for item in self.table.query(hash_key='password', request_limit=2, scan_index_forward=False)]
+        exact = [item['secret_version'] for item in self.table.query(hash_key='password', range_key_condition=EQ(2))]
+
+        # THEN
+        assert_equals([{'secret_version': 10}], newest)
+        assert_equals([10, 3, 2, 1], paged)
+        assert_equals([2], exact)
+
+    def test_GIVEN_scan_filter_WHEN_scan_read_a_page_at_a_time_THEN_every_matching_item_returned_once(self):
+        # GIVEN
+        self._put_versions('billing/a', [1, 2, 3])
+        self._put_versions('billing/b', [1, 2])
+        self._put_versions('web/c', [1])
+        scan_filter = {'secret_name': BEGINS_WITH('billing/'), 'last_data_key_rotation': LT(250)}
+
+        # WHEN
+        found = []
+        start_key = None
+        while True:
+            results = self.table.scan(scan_filter=scan_filter, request_limit=2, exclusive_start_key=start_key)
+            found.extend((attrs['secret_name'], attrs['secret_version']) for attrs in results.response['Items'])
+            start_key = results.last_evaluated_key
+            if start_key is None:
+                break
+
+        # THEN
+        assert_equals([('billing/a', 1), ('billing/a', 2), ('billing/b', 1), ('billing/b', 2)], found)
+        assert_equals(found, [(item['secret_name'], item['secret_version']) for item in self.table.scan(scan_filter=scan_filter)])
+
+    def test_WHEN_batch_write_and_batch_get_item_called_THEN_items_written_deleted_and_missing_keys_skipped(self):
+        # GIVEN
+        self._put_versions('password', [1, 2])
+
+        # WHEN
+        self.table.batch_write(puts=[self.table.new_item(attrs={'secret_name': 'api_key', 'secret_version': 1})], deletes=[('password', 1)])
+        found = self.table.batch_get_item(keys=[('password', 1), ('password', 2), ('api_key', 1)])
+
+        # THEN
+        assert_equals([('password', 2), ('api_key', 1)], [(item['secret_name'], item['secret_version']) for item in found])
+
+    def test_GIVEN_items_WHEN_table_deleted_THEN_table_empty(self):
+        # GIVEN
+        self._put_versions('password', [1, 2])
+
+        # WHEN
+        self.table.delete()
+
+        # THEN
+        assert_equals([], list(self.table.scan()))
+
+class MemoryBackendTests(BackendTests, TestCase):
+
+    def make_backend(self):
+        return MemoryBackend()
+
+class SQLiteBackendTests(BackendTests, TestCase):
+
+    def make_backend(self):
+        return SQLiteBackend(os.path.join(self.directory, 'kaurna.db'))
+
+    def test_GIVEN_items_written_WHEN_database_reopened_THEN_items_still_there_and_database_in_wal_mode(self):
+        # GIVEN
+        self._put_versions('password', [1, 2])
+        self.backend.close()
+
+        # WHEN
+        backend = SQLiteBackend(os.path.join(self.directory, 'kaurna.db'))
+        table = backend.get_table(name='kaurna', hash_key_name='secret_name', hash_key_type=str, range_key_name='secret_version', range_key_type=int, region='us-west-1')
+
+        # THEN
+        assert_equals([1, 2], [item['secret_version'] for item in table.query(hash_key='password')])
+        assert_equals([], list(backend.get_table(name='kaurna', hash_key_name='secret_name', hash_key_type=str, range_key_name='secret_version', range_key_type=int, region='us-east-1').scan()))
+        assert_equals('wal', backend._connection.execute('PRAGMA journal_mode').fetchone()[0])
+        backend.close()
+
+class ConfiguredStorageTests(TestCase):
+
+    def setUp(self):
+        kaurna.reset_clients()
+        kaurna.disable_secret_cache()
+        kaurna.disable_data_key_cache()
+        self.mock_kms = MagicMock()
+        self.mock_kms.generate_data_key.return_value = {'Plaintext': b'E' * 32, 'CiphertextBlob': b'wrapped data key'}
+        self.mock_kms.decrypt.return_value = {'Plaintext': b'E' * 32}
+        patch('kaurna.boto.kms.connect_to_region', MagicMock(return_value=self.mock_kms)).start()
+        self.mock_connect_ddb = patch('kaurna.boto.dynamodb.connect_to_region').start()
+        self.region = 'us-west-1'
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        patch.stopall()
+        kaurna.configure_storage('dynamodb')
+        kaurna.configure_key_provider('kms')
+        shutil.rmtree(self.directory)
+
+    def _rotate_and_update(self):
+        # stores two versions, then rotates, rewraps and re-authorizes them every way there is, returning the data keys
+        # after each step, the parallel rotation's summary and the secrets at the end
+        kaurna.configure_key_provider('local:' + os.path.join(self.directory, 'master.key'))
+        kaurna.store_secret(secret_name='password', secret='guest', authorized_entities=['Sterling Archer'], region=self.region)
+        kaurna.store_secret(secret_name='password', secret='swordfish', authorized_entities=['Sterling Archer'], region=self.region)
+        data_keys = lambda: [item['encrypted_data_key'] for item in kaurna.load_all_entries(secret_name='password', region=self.region)]
+        steps = [data_keys()]
+        kaurna.rotate_data_keys(region=self.region)
+        steps.append(data_keys())
+        kaurna.rotate_data_keys(region=self.region, rewrap=True)
+        steps.append(data_keys())
+        summary = kaurna.rotate_data_keys(region=self.region, workers=2)
+        steps.append(data_keys())
+        kaurna.update_secrets(secret_name='password', authorized_entities=['Cyril Figgis'], region=self.region)
+        steps.append(data_keys())
+        kaurna.update_secrets(secret_name='password', authorized_entities=['Cyril Figgis', 'Pam Poovey'], region=self.region, rewrap=True)
+        steps.append(data_keys())
+        return steps, summary, kaurna.get_secrets([('password', 1), ('password', 2)], region=self.region)
+
+    def _assert_rotated_and_updated(self, steps, summary, secrets):
+        assert_equals(12, len(set(data_key for step in steps for data_key in step)))
+        assert_equals((2, 0), (summary['processed'], summary['failed']))
+        assert_equals({('password', 1): b'guest', ('password', 2): b'swordfish'}, secrets)
+        assert_equals([['Cyril Figgis', 'Pam Poovey']] * 2, [record['authorized_entities'] for record in kaurna.iter_secrets(secret_name='password', region=self.region)])
+        assert_equals([('password', 1), ('password', 2)], kaurna.secrets_for_entity('Pam Poovey', region=self.region))
+        assert_equals([], kaurna.secrets_for_entity('Sterling Archer', region=self.region))
+
+    def test_GIVEN_memory_storage_configured_WHEN_secrets_stored_read_deprecated_and_erased_THEN_dynamodb_never_used(self):
+        # GIVEN
+        kaurna.configure_storage('memory')
+
+        # WHEN
+        kaurna.store_secret(secret_name='password', secret='guest', authorized_entities=['Sterling Archer'], region=self.region)
+        kaurna.store_secret(secret_name='password', secret='swordfish', authorized_entities=['Sterling Archer'], region=self.region)
+        latest = kaurna.get_secret(secret_name='password', region=self.region)
+        kaurna.deprecate_secrets(secret_name='password', secret_version=2, region=self.region)
+        active = kaurna.get_secret(secret_name='password', region=self.region)
+        batch = kaurna.get_secrets([('password', 1), 'password'], region=self.region)
+        entity_secrets = kaurna.secrets_for_entity('Sterling Archer', region=self.region)
+        erased = kaurna.erase_secret(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals((b'swordfish', b'guest'), (latest, active))
+        assert_equals({('password', 1): b'guest', 'password': b'guest'}, batch)
+        assert_equals([('password', 1), ('password', 2)], entity_secrets)
+        assert_equals(2, erased)
+        assert_equals({}, kaurna.describe_secrets(region=self.region))
+        assert_equals([], kaurna.secrets_for_entity('Sterling Archer', region=self.region))
+        assert_equals(0, self.mock_connect_ddb.call_count)
+
+    def test_GIVEN_memory_storage_configured_WHEN_data_keys_rotated_rewrapped_and_entities_updated_THEN_secrets_still_readable(self):
+        # GIVEN
+        kaurna.configure_storage('memory')
+
+        # WHEN
+        steps, summary, secrets = self._rotate_and_update()
+
+        # THEN
+        self._assert_rotated_and_updated(steps, summary, secrets)
+
+    def test_GIVEN_sqlite_storage_configured_WHEN_data_keys_rotated_rewrapped_and_entities_updated_THEN_secrets_still_readable(self):
+        # GIVEN
+        kaurna.configure_storage('sqlite:' + os.path.join(self.directory, 'kaurna.db'))
+
+        # WHEN
+        steps, summary, secrets = self._rotate_and_update()
+
+        # THEN
+        self._assert_rotated_and_updated(steps, summary, secrets)
+
+    def test_GIVEN_memory_storage_configured_WHEN_data_keys_rewrapped_THEN_encrypted_secrets_not_rewritten(self):
+        # GIVEN
+        kaurna.configure_storage('memory')
+        kaurna.configure_key_provider('local:' + os.path.join(self.directory, 'master.key'))
+        kaurna.store_secret(secret_name='password', secret='guest', authorized_entities=['Sterling Archer'], region=self.region)
+        kaurna.store_secret(secret_name='password', secret='swordfish', authorized_entities=['Sterling Archer'], region=self.region)
+        mock_update_item = patch.object(LocalTable, 'update_item', autospec=True, side_effect=LocalTable.update_item).start()
+
+        # WHEN
+        kaurna.rotate_data_keys(region=self.region, rewrap=True)
+        kaurna.update_secrets(secret_name='password', authorized_entities=['Cyril Figgis'], region=self.region, rewrap=True)
+
+        # THEN
+        assert_equals([sorted(['authorized_entities', 'encryption_context', 'encrypted_data_key', 'last_data_key_rotation'])] * 4, [sorted(c[0][2]) for c in mock_update_item.call_args_list])
+        assert_equals({('password', 1): b'guest', ('password', 2): b'swordfish'}, kaurna.get_secrets([('password', 1), ('password', 2)], region=self.region))
+
+    def test_GIVEN_memory_storage_configured_WHEN_format_1_secret_streamed_in_and_rotated_THEN_it_reads_back_the_same(self):
+        # GIVEN
+        kaurna.configure_storage('memory')
+        kaurna.configure_key_provider('local:' + os.path.join(self.directory, 'master.key'))
+        secret = b'apiVersion: v1\n' + b'\xff' * 250
+
+        # WHEN
+        kaurna.store_secret_stream(secret_name='kubeconfig', stream=io.BytesIO(secret), authorized_entities=['Sterling Archer'], region=self.region, format_version=1, chunk_size=100)
+        stored = b''.join(kaurna.get_secret_stream(secret_name='kubeconfig', region=self.region))
+        kaurna.rotate_data_keys(region=self.region)
+        kaurna.rotate_data_keys(region=self.region, rewrap=True)
+        rotated = b''.join(kaurna.get_secret_stream(secret_name='kubeconfig', region=self.region))
+
+        # THEN
+        assert_equals((secret, secret), (stored, rotated))
+        assert_equals([3], [int(item['chunk_count']) for item in kaurna.load_all_entries(secret_name='kubeconfig', region=self.region)])
+
+    def test_GIVEN_sqlite_storage_configured_WHEN_secret_stored_THEN_it_can_be_read_after_reconfiguring(self):
+        # GIVEN
+        kaurna.configure_storage('sqlite:' + os.path.join(self.directory, 'kaurna.db'))
+        kaurna.store_secret(secret_name='password', secret='guest', region=self.region)
+
+        # WHEN
+        kaurna.configure_storage('sqlite:' + os.path.join(self.directory, 'kaurna.db'))
+        secret = kaurna.get_secret(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals(b'guest', secret)
+
+    @raises(Exception)
+    def test_WHEN_configure_storage_called_with_unknown_backend_THEN_error_thrown(self):
+        kaurna.configure_storage('cassandra')
@@ -1,18 +1,37 @@
 #!/usr/bin/env python
 
-from boto.dynamodb.condition import EQ
+from boto.dynamodb.condition import BEGINS_WITH, EQ, LT
+from boto.dynamodb.exceptions import DynamoDBConditionalCheckFailedError
+from boto.dynamodb.item import Item
+from boto.dynamodb.types import Binary, LossyFloatDynamizer
 from boto.exception import DynamoDBResponseError
 from kaurna import *
 import kaurna # necessary to test _generate_encryption_context
+from Crypto.Cipher import AES
+import io
+from kaurna.blobs import LocalBlobStore
 from mock import call, MagicMock, Mock, patch
+from nose.plugins.skip import SkipTest
 from nose.tools import assert_equals, raises
+import os
+import shutil
+import tempfile
 from unittest import TestCase
+import zlib
 
 # http://www.openp2p.com/pub/a/python/2004/12/02/tdd_pyunit.html
 
+# setUp patches out the entity index so that tests of the main table don't have to mock both tables; the index tests
+# call the real function through this reference.
+_update_entity_index = kaurna._update_entity_index
+
 class KaurnaUtilsTests(TestCase):
 
     def setUp(self):
+        kaurna.reset_clients()
+        kaurna.disable_secret_cache()
+        kaurna.disable_data_key_cache()
+
         self.mock_kms = MagicMock()
         self.mock_connect_kms = MagicMock(return_value=self.mock_kms)
         patch('kaurna.boto.kms.connect_to_region', self.mock_connect_kms).start()
@@ -23,6 +42,8 @@ class KaurnaUtilsTests(TestCase):
 
         self.region = 'us-west-1'
 
+        self.mock_update_entity_index = patch('kaurna._update_entity_index').start()
+
     def tearDown(self):
         patch.stopall()
 
@@ -69,6 +90,76 @@ class KaurnaUtilsTests(TestCase):
             []
             )
 
+    def test_GIVEN_kaurna_table_already_loaded_WHEN_get_kaurna_table_called_THEN_pooled_table_returned(self):
+        # GIVEN
+        mock_table = MagicMock()
+        self.mock_ddb.get_table.return_value = mock_table
+
+        # WHEN
+        first_table = get_kaurna_table(region=self.region)
+        second_table = get_kaurna_table(region=self.region)
+
+        # THEN
+        assert_equals(mock_table, first_table)
+        assert_equals(mock_table, second_table)
+        assert_equals(
+            self.mock_connect_ddb.call_args_list,
+            [call(region_name=self.region)]
+            )
+        assert_equals(
+            self.mock_ddb.get_table.call_args_list,
+            [call(name='kaurna')]
+            )
+
+    def test_GIVEN_different_regions_WHEN_get_kaurna_table_called_THEN_one_connection_per_region(self):
+        # GIVEN
+        self.mock_ddb.get_table.return_value = MagicMock()
+
+        # WHEN
+        get_kaurna_table(region=self.region)
+        get_kaurna_table(region='eu-west-1')
+        get_kaurna_table(region=self.region)
+
+        # THEN
+        assert_equals(
+            self.mock_connect_ddb.call_args_list,
+            [call(region_name=self.region), call(region_name='eu-west-1')]
+            )
+
+    def test_GIVEN_clients_invalidated_WHEN_get_kaurna_table_called_THEN_reconnects(self):
+        # GIVEN
+        self.mock_ddb.get_table.return_value = MagicMock()
+        get_kaurna_table(region=self.region)
+
+        # WHEN
+        invalidate_clients(region=self.region)
+        get_kaurna_table(region=self.region)
+
+        # THEN
+        assert_equals(
+            self.mock_connect_ddb.call_args_list,
+            [call(region_name=self.region), call(region_name=self.region)]
+            )
+        assert_equals(
+            self.mock_ddb.get_table.call_args_list,
+            [call(name='kaurna'), call(name='kaurna')]
+            )
+
+    def test_WHEN_kms_used_repeatedly_THEN_kms_connection_reused(self):
+        # GIVEN
+        self.mock_kms.generate_data_key.return_value = {'Plaintext': '<binary blob>', 'CiphertextBlob': '<binary blob>'}
+        self.mock_kms.decrypt.return_value = {'Plaintext': '<binary blob>'}
+
+        # WHEN
+        get_data_key(encryption_context=None, region=self.region)
+        decrypt_with_kms(binascii.b2a_base64('<binary blob>'), None, region=self.region)
+
+        # THEN
+        assert_equals(
+            self.mock_connect_kms.call_args_list,
+            [call(region_name=self.region)]
+            )
+
     def test_GIVEN_kaurna_key_doesnt_exist_WHEN_create_kaurna_key_called_THEN_kaurna_key_created(self):
         # GIVEN
         self.mock_kms.list_aliases.return_value = {'Aliases':[
@@ -205,14 +296,12 @@ class KaurnaUtilsTests(TestCase):
         secret_version = 3
         authorized_entities = ['Sterling Archer', 'Cyril Figgis']
 
-        patch(
-            'kaurna.load_all_entries',
-            Mock(
-                return_value = [
-                    {'secret_name':'password','secret_version':3}
-                    ]
-                )
-            ).start()
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob':'abcdabcdabcdabcd','Plaintext':'1234123412341234'})).start()
+        patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+
+        mock_table = MagicMock()
+        mock_table.new_item.return_value.put.side_effect = DynamoDBConditionalCheckFailedError(400, 'Bad Request', {'__type': 'ConditionalCheckFailedException'})
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
 
         # WHEN
         store_secret(secret=secret, secret_name=secret_name, secret_version=secret_version, authorized_entities=authorized_entities, region=self.region)
@@ -227,15 +316,10 @@ class KaurnaUtilsTests(TestCase):
         secret_version = None
         authorized_entities = ['Sterling Archer', 'Cyril Figgis']
 
+        mock_latest_secret_version = MagicMock(return_value = 4)
         patch(
-            'kaurna.load_all_entries',
-            Mock(
-                return_value = [
-                    {'secret_name':'password','secret_version':1},
-                    {'secret_name':'password','secret_version':2},
-                    {'secret_name':'password','secret_version':4}
-                    ]
-                )
+            'kaurna._latest_secret_version',
+            mock_latest_secret_version
             ).start()
 
         patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob':'abcdabcdabcdabcd','Plaintext':'1234123412341234'})).start()
@@ -258,7 +342,9 @@ class KaurnaUtilsTests(TestCase):
             'authorized_entities': json.dumps(authorized_entities),
             'create_date': 1234,
             'last_data_key_rotation': 1234,
-            'deprecated': False
+            'deprecated': False,
+            'secret_size': 5,
+            'stored_size': len('<insert encrypted stuff here>')
             }
 
         # WHEN
@@ -274,8 +360,12 @@ class KaurnaUtilsTests(TestCase):
             [call(attrs=expected_attributes)]
             )
         assert_equals(
-            mock_item.save.call_args_list,
-            [call()]
+            mock_item.put.call_args_list,
+            [call(expected_value={'secret_version': False})]
+            )
+        assert_equals(
+            mock_latest_secret_version.call_args_list,
+            [call(secret_name=secret_name, region=self.region)]
             )
 
     def test_GIVEN_secret_version_provided_WHEN_store_secret_called_THEN_secret_properly_stored(self):
@@ -285,11 +375,10 @@ class KaurnaUtilsTests(TestCase):
         secret_version = 3
         authorized_entities = ['Sterling Archer', 'Cyril Figgis']
 
+        mock_latest_secret_version = MagicMock(return_value = 4)
         patch(
-            'kaurna.load_all_entries',
-            Mock(
-                return_value = []
-                )
+            'kaurna._latest_secret_version',
+            mock_latest_secret_version
             ).start()
 
         patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob':'abcdabcdabcdabcd','Plaintext':'1234123412341234'})).start()
@@ -312,7 +401,9 @@ class KaurnaUtilsTests(TestCase):
             'authorized_entities': json.dumps(authorized_entities),
             'create_date': 1234,
             'last_data_key_rotation': 1234,
-            'deprecated': False
+            'deprecated': False,
+            'secret_size': 5,
+            'stored_size': len('<insert encrypted stuff here>')
             }
 
         # WHEN
@@ -328,10 +419,323 @@ class KaurnaUtilsTests(TestCase):
             [call(attrs=expected_attributes)]
             )
         assert_equals(
-            mock_item.save.call_args_list,
-            [call()]
+            mock_item.put.call_args_list,
+            [call(expected_value={'secret_version': False})]
+            )
+        assert_equals(
+            mock_latest_secret_version.call_args_list,
+            []
+            )
+        assert_equals(
+            self.mock_update_entity_index.call_args_list,
+            [call([(secret_name, secret_version, None, authorized_entities)], region=self.region)]
+            )
+
+    def test_GIVEN_another_writer_takes_the_version_WHEN_store_secret_called_THEN_next_version_used(self):
+        # GIVEN
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob':'abcdabcdabcdabcd','Plaintext':'1234123412341234'})).start()
+        patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+        patch('kaurna._latest_secret_version', MagicMock(side_effect = [4, 5])).start()
+        mock_sleep = patch('kaurna.time.sleep').start()
+
+        mock_table = MagicMock()
+        mock_item = MagicMock()
+        mock_item.put.side_effect = [DynamoDBConditionalCheckFailedError(400, 'Bad Request', {'__type': 'ConditionalCheckFailedException'}), {}]
+        mock_table.new_item.return_value = mock_item
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        store_secret(secret='guest', secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals(
+            [c[1]['attrs']['secret_version'] for c in mock_table.new_item.call_args_list],
+            [5, 6]
+            )
+        assert_equals(2, mock_item.put.call_count)
+        assert_equals(1, mock_sleep.call_count)
+        assert 0 <= mock_sleep.call_args[0][0] <= 2 * kaurna.STORE_SECRET_BACKOFF
+
+    def test_GIVEN_entity_index_not_writable_WHEN_store_secret_called_THEN_secret_stored_once_and_error_logged(self):
+        # GIVEN
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob':'abcdabcdabcdabcd','Plaintext':'1234123412341234'})).start()
+        patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+        patch('kaurna._latest_secret_version', MagicMock(return_value=4)).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        self.mock_update_entity_index.side_effect = DynamoDBResponseError(400, 'Bad Request', {'__type': 'ResourceNotFoundException', 'message': 'Requested resource not found'})
+        mock_logger = patch('kaurna.logging.getLogger').start().return_value
+
+        # WHEN
+        store_secret(secret='guest', secret_name='password', authorized_entities=['Sterling Archer'], region=self.region)
+
+        # THEN
+        assert_equals(1, mock_table.new_item.return_value.put.call_count)
+        assert_equals([call([('password', 5, None, ['Sterling Archer'])], region=self.region)], self.mock_update_entity_index.call_args_list)
+        assert_equals(1, mock_logger.warning.call_count)
+
+    def test_WHEN__latest_secret_version_called_THEN_only_newest_key_read(self):
+        # GIVEN
+        mock_table = MagicMock()
+        mock_table.query.return_value = [{'secret_version': 7}]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        latest = kaurna._latest_secret_version(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals(7, latest)
+        assert_equals(
+            mock_table.query.call_args_list,
+            [call(hash_key='password', attributes_to_get=['secret_version'], max_results=1, scan_index_forward=False, consistent_read=True)]
+            )
+
+    def test_GIVEN_entities_added_and_removed_WHEN__update_entity_index_called_THEN_only_differences_written(self):
+        # GIVEN
+        mock_entity_table = MagicMock()
+        mock_entity_table.new_item.side_effect = lambda attrs: attrs
+        patch('kaurna.get_kaurna_entity_table', MagicMock(return_value=mock_entity_table)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+
+        # WHEN
+        _update_entity_index([('password', 2, ['Sterling Archer', 'Cyril Figgis'], ['Cyril Figgis', 'Lana Kane']), ('api_key', 1, None, ['Lana Kane'])], region=self.region)
+
+        # THEN
+        assert_equals(
+            mock_batch_write.call_args_list,
+            [call(
+                mock_entity_table,
+                puts=[
+                    {'entity': 'Lana Kane', 'secret': 'password/2', 'secret_name': 'password', 'secret_version': 2},
+                    {'entity': 'Lana Kane', 'secret': 'api_key/1', 'secret_name': 'api_key', 'secret_version': 1}
+                    ],
+                deletes=[('Sterling Archer', 'password/2')]
+                )]
+            )
+
+    def test_GIVEN_nothing_changed_WHEN__update_entity_index_called_THEN_nothing_written(self):
+        # GIVEN
+        patch('kaurna.get_kaurna_entity_table').start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+
+        # WHEN
+        _update_entity_index([('password', 2, ['Sterling Archer'], ['Sterling Archer'])], region=self.region)
+
+        # THEN
+        assert_equals(0, mock_batch_write.call_count)
+
+    def test_WHEN_secrets_for_entity_called_THEN_entity_index_queried(self):
+        # GIVEN
+        mock_entity_table = MagicMock()
+        mock_entity_table.query.return_value = [{'secret_name': 'password', 'secret_version': 2}, {'secret_name': 'api_key', 'secret_version': 1}]
+        patch('kaurna.get_kaurna_entity_table', MagicMock(return_value=mock_entity_table)).start()
+
+        # WHEN
+        secrets = secrets_for_entity('Lana Kane', region=self.region)
+
+        # THEN
+        assert_equals([('api_key', 1), ('password', 2)], secrets)
+        assert_equals(
+            mock_entity_table.query.call_args_list,
+            [call(hash_key='Lana Kane', attributes_to_get=['secret_name', 'secret_version'])]
+            )
+
+    def test_GIVEN_index_out_of_date_WHEN_rebuild_entity_index_called_THEN_missing_entries_added_and_stale_ones_removed(self):
+        # GIVEN
+        patch('kaurna.load_all_entries', MagicMock(return_value=[{'secret_name': 'password', 'secret_version': 2, 'authorized_entities': '["Lana Kane", "Cyril Figgis"]'}, {'secret_name': 'api_key', 'secret_version': 1, 'authorized_entities': 'null'}])).start()
+        mock_entity_table = MagicMock()
+        mock_entity_table.scan.return_value = [{'entity': 'Cyril Figgis', 'secret_name': 'password', 'secret_version': 2}, {'entity': 'Cyril Figgis', 'secret_name': 'old_password', 'secret_version': 1}]
+        patch('kaurna.get_kaurna_entity_table', MagicMock(return_value=mock_entity_table)).start()
+
+        # WHEN
+        summary = rebuild_entity_index(region=self.region)
+
+        # THEN
+        assert_equals({'added': 1, 'removed': 1}, summary)
+        assert_equals(
+            sorted(self.mock_update_entity_index.call_args[0][0]),
+            [('old_password', 1, ['Cyril Figgis'], None), ('password', 2, None, ['Lana Kane'])]
+            )
+
+    def test_GIVEN_jsonl_and_dotenv_lines_WHEN_import_secrets_called_THEN_versions_allocated_and_batch_written(self):
+        # GIVEN
+        lines = [
+            '# seeded from staging\n',
+            '{"secret_name": "password", "secret": "guest", "authorized_entities": ["webapp"]}\n',
+            'export API_KEY="abc=123"\n',
+            '\n',
+            'password=new guest\n'
+            ]
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_latest = patch('kaurna._latest_secret_version', MagicMock(side_effect=lambda secret_name, region: {'password': 3, 'API_KEY': 0}[secret_name])).start()
+        mock_attrs = patch('kaurna._new_secret_attrs', MagicMock(side_effect=lambda **kwargs: kwargs)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+        mock_table.new_item.side_effect = lambda attrs: attrs
+
+        # WHEN
+        summary = kaurna.import_secrets(lines, authorized_entities=['cron'], region=self.region)
+
+        # THEN
+        assert_equals(3, summary['imported'])
+        assert_equals(2, mock_latest.call_count)
+        assert_equals(
+            sorted(mock_attrs.call_args_list),
+            sorted([
+                call(secret_name='password', secret='guest', secret_version=4, authorized_entities=['webapp'], region=self.region, format_version=None, compression=None, compression_threshold=None),
+                call(secret_name='API_KEY', secret='abc=123', secret_version=1, authorized_entities=['cron'], region=self.region, format_version=None, compression=None, compression_threshold=None),
+                call(secret_name='password', secret='new guest', secret_version=5, authorized_entities=['cron'], region=self.region, format_version=None, compression=None, compression_threshold=None)
+                ])
+            )
+        assert_equals(1, mock_batch_write.call_count)
+        assert_equals(3, len(mock_batch_write.call_args[1]['puts']))
+
+    def test_GIVEN_explicit_and_allocated_versions_of_one_secret_WHEN_import_secrets_called_THEN_allocated_versions_follow_explicit_ones(self):
+        # GIVEN
+        lines = [
+            '{"secret_name": "password", "secret": "guest", "secret_version": 2}\n',
+            'password=new guest\n',
+            'password=newer guest\n'
+            ]
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna._new_secret_attrs', MagicMock(side_effect=lambda **kwargs: kwargs)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+        mock_put_new_item = patch('kaurna._put_new_item').start()
+        mock_table.new_item.side_effect = lambda attrs: attrs
+
+        # WHEN
+        summary = kaurna.import_secrets(lines, region=self.region)
+
+        # THEN
+        assert_equals(3, summary['imported'])
+        assert_equals([3, 4], sorted(attrs['secret_version'] for attrs in mock_batch_write.call_args[1]['puts']))
+        assert_equals(1, mock_put_new_item.call_count)
+        assert_equals(2, mock_put_new_item.call_args[1]['secret_version'])
+        assert_equals(
+            sorted([('password', 2, None, None), ('password', 3, None, None), ('password', 4, None, None)]),
+            sorted(self.mock_update_entity_index.call_args[0][0])
             )
 
+    @raises(Exception)
+    def test_GIVEN_same_version_twice_WHEN_import_secrets_called_THEN_error_thrown_before_anything_written(self):
+        # GIVEN
+        lines = [
+            '{"secret_name": "password", "secret": "guest", "secret_version": 2}\n',
+            '{"secret_name": "password", "secret": "new guest", "secret_version": "2"}\n'
+            ]
+        patch('kaurna.get_kaurna_table').start()
+        patch('kaurna._new_secret_attrs').start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+        mock_put_new_item = patch('kaurna._put_new_item').start()
+
+        # WHEN
+        try:
+            kaurna.import_secrets(lines, region=self.region)
+        finally:
+            # THEN
+            assert_equals(0, mock_batch_write.call_count)
+            assert_equals(0, mock_put_new_item.call_count)
+
+    def test_GIVEN_explicit_version_that_exists_WHEN_import_secrets_called_THEN_it_is_not_overwritten_and_error_thrown(self):
+        # GIVEN
+        lines = [
+            'API_KEY=abc=123\n',
+            '{"secret_name": "password", "secret": "guest", "secret_version": 2}\n'
+            ]
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna._new_secret_attrs', MagicMock(side_effect=lambda **kwargs: kwargs)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+        mock_table.new_item.side_effect = lambda attrs: MagicMock(put=MagicMock(side_effect=DynamoDBConditionalCheckFailedError(400, 'Bad Request', {'__type': 'ConditionalCheckFailedException'})))
+
+        # WHEN
+        try:
+            kaurna.import_secrets(lines, region=self.region)
+            raise AssertionError('import_secrets should have failed')
+        except Exception as e:
+            error = str(e)
+
+        # THEN
+        assert 'version 2 of secret \'password\'' in error, error
+        assert_equals(1, len(mock_batch_write.call_args[1]['puts']))
+        assert_equals([('API_KEY', 1, None, None)], self.mock_update_entity_index.call_args[0][0])
+
+    @raises(Exception)
+    def test_GIVEN_line_without_equals_WHEN_import_secrets_called_THEN_error_thrown(self):
+        # GIVEN
+        patch('kaurna.get_kaurna_table').start()
+
+        # WHEN
+        kaurna.import_secrets(['not a secret\n'], region=self.region)
+
+        # THEN
+        # Exception should get thrown and we should never get here
+
+    def test_GIVEN_unprocessed_items_WHEN__batch_write_called_THEN_unprocessed_items_resubmitted(self):
+        # GIVEN
+        patch('kaurna.time.sleep').start()
+        mock_table = MagicMock()
+        mock_table.name = 'kaurna'
+        mock_table.layer2.dynamize_item.side_effect = lambda item: item
+        items = ['item{0}'.format(i) for i in range(30)]
+        unprocessed = {'kaurna': [{'PutRequest': {'Item': 'item3'}}]}
+        mock_table.layer2.layer1.batch_write_item.side_effect = [{'UnprocessedItems': unprocessed}, {}, {'UnprocessedItems': {}}]
+
+        # WHEN
+        kaurna._batch_write(mock_table, puts=items)
+
+        # THEN
+        requests = [c[0][0] for c in mock_table.layer2.layer1.batch_write_item.call_args_list]
+        assert_equals(3, len(requests))
+        assert_equals([{'PutRequest': {'Item': item}} for item in items[:25]], requests[0]['kaurna'])
+        assert_equals(unprocessed, requests[1])
+        assert_equals([{'PutRequest': {'Item': item}} for item in items[25:]], requests[2]['kaurna'])
+
+    def test_GIVEN_segments_WHEN_load_all_entries_called_THEN_segments_scanned_concurrently_and_merged(self):
+        # GIVEN
+        mock_table = MagicMock()
+        mock_table.name = 'kaurna'
+        mock_table.schema.hash_key_name = 'secret_name'
+        mock_table.schema.range_key_name = 'secret_version'
+        mock_table.layer2.dynamizer = LossyFloatDynamizer()
+        mock_table.layer2.dynamize_scan_filter.return_value = None
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_connection = MagicMock()
+        patch('kaurna._get_ddb2_connection', MagicMock(return_value=mock_connection)).start()
+        responses = {
+            (0, None): {'Items': [{'secret_name': {'S': 'a'}, 'secret_version': {'N': '1'}}], 'LastEvaluatedKey': {'secret_name': {'S': 'a'}}},
+            (0, 'a'): {'Items': [{'secret_name': {'S': 'b'}, 'secret_version': {'N': '1'}}]},
+            (1, None): {'Items': [{'secret_name': {'S': 'c'}, 'secret_version': {'N': '2'}}]}
+            }
+        mock_connection.scan.side_effect = lambda table_name, exclusive_start_key, segment, **kwargs: responses[(segment, exclusive_start_key and exclusive_start_key['secret_name']['S'])]
+
+        # WHEN
+        items = list(load_all_entries(region=self.region, segments=2))
+
+        # THEN
+        assert_equals(sorted((item['secret_name'], item['secret_version']) for item in items), [('a', 1), ('b', 1), ('c', 2)])
+        assert_equals(3, mock_connection.scan.call_count)
+        assert_equals(set([2]), set(c[1]['total_segments'] for c in mock_connection.scan.call_args_list))
+        assert_equals(0, mock_table.scan.call_count)
+
+    @raises(DynamoDBResponseError)
+    def test_GIVEN_segment_fails_WHEN_load_all_entries_called_THEN_error_raised(self):
+        # GIVEN
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_connection = MagicMock()
+        mock_connection.scan.side_effect = DynamoDBResponseError(400, 'ProvisionedThroughputExceededException')
+        patch('kaurna._get_ddb2_connection', MagicMock(return_value=mock_connection)).start()
+
+        # WHEN
+        list(load_all_entries(region=self.region, segments=4))
+
+        # THEN
+        # Exception should get thrown and we should never get here
+
     @raises(Exception)
     def test_GIVEN_secret_version_but_not_secret_name_provided_WHEN_load_all_entries_called_THEN_error_thrown(self):
         # GIVEN
@@ -467,7 +871,7 @@ class KaurnaUtilsTests(TestCase):
         # THEN
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, rotated_before=None, segments=None)]
             )
         assert_equals(
             mock_reencrypt_item_and_save.call_args_list,
@@ -502,84 +906,257 @@ class KaurnaUtilsTests(TestCase):
         # THEN
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, rotated_before=None, segments=None)]
             )
         assert_equals(
             mock_reencrypt_item_and_save.call_args_list,
             [call(item=item, region=self.region)]
             )
 
-    def test_WHEN__reencrypt_item_and_save_called_THEN_item_reencrypted_and_saved(self):
+    def test_GIVEN_older_than_WHEN_rotate_data_keys_called_THEN_only_stale_items_scanned_for(self):
         # GIVEN
-
         item = MagicMock()
-        item.getitem.side_effect = ['old_encrypted_secret', 'old_encrypted_data_key', '{"Mallory Archer": "kaurna"}', '["Sterling Archer", "Cyril Figgis"]']
+        mock_table = MagicMock()
+        mock_table.scan.return_value = [item]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        patch('kaurna.time.time', Mock(return_value=10000000.5)).start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
 
-        mock_get_data_key = MagicMock(return_value = {'Plaintext':'data_key_plaintext', 'CiphertextBlob':'data_key_ciphertext'})
-        patch(
-            'kaurna.get_data_key',
-            mock_get_data_key
-            ).start()
+        # WHEN
+        rotate_data_keys(region=self.region, older_than=90 * 86400)
 
-        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': 'decrypt_with_kms_output'})
-        patch(
-            'kaurna.decrypt_with_kms',
-            mock_decrypt_with_kms
-            ).start()
+        # THEN
+        assert_equals(
+            mock_table.scan.call_args_list,
+            [call(scan_filter={'last_data_key_rotation': LT(10000000 - 90 * 86400)}, attributes_to_get=None)]
+            )
+        assert_equals(mock_reencrypt_item_and_save.call_args_list, [call(item=item, region=self.region)])
 
-        mock_decrypt_with_key = MagicMock(return_value = 'decrypt_with_key_output')
-        patch(
-            'kaurna.decrypt_with_key',
-            mock_decrypt_with_key
-            ).start()
+    def test_GIVEN_secret_name_and_rotated_before_WHEN_load_all_entries_called_THEN_fresh_items_filtered_out(self):
+        # GIVEN
+        stale = {'secret_version': 1, 'last_data_key_rotation': 100}
+        fresh = {'secret_version': 2, 'last_data_key_rotation': 500}
+        mock_table = MagicMock()
+        mock_table.query.return_value = [stale, fresh]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
 
-        mock_encrypt_with_key = MagicMock(return_value = 'encrypt_with_key_output')
-        patch(
-            'kaurna.encrypt_with_key',
-            mock_encrypt_with_key
-            ).start()
+        # WHEN
+        items = load_all_entries(secret_name='password', region=self.region, rotated_before=200)
 
-        patch(
-            'kaurna.time.time',
-            Mock(return_value = 1234.567)
-            ).start()
+        # THEN
+        assert_equals([stale], list(items))
 
-        # WHEN
+    def test_GIVEN_workers_WHEN_rotate_data_keys_called_THEN_pages_rotated_in_parallel(self):
+        # GIVEN
+        items = [{'secret_name': 'password', 'secret_version': version} for version in [1, 2, 3]]
+        mock_entry_pages = patch('kaurna._entry_pages', MagicMock(return_value=iter([(items[:2], ('password', 2)), (items[2:], None)]))).start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
 
-        output = kaurna._reencrypt_item_and_save(item=item, region=self.region)
+        # WHEN
+        summary = rotate_data_keys(secret_name='password', region=self.region, workers=2)
 
         # THEN
-
         assert_equals(
-            item.mock_calls,
-            [
-                call.getitem('encrypted_secret'),
-                call.getitem('encrypted_data_key'),
-                call.getitem('encryption_context'),
-                call.getitem('authorized_entities'),
-                call.__setitem__('encryption_context', '{"Sterling Archer": "kaurna", "Cyril Figgis": "kaurna"}'),
-                call.__setitem__('encrypted_secret', 'encrypt_with_key_output'),
-                call.__setitem__('encrypted_data_key', 'ZGF0YV9rZXlfY2lwaGVydGV4dA==\n'),
-                call.__setitem__('last_data_key_rotation', 1234),
-                call.save()
-                ]
+            mock_entry_pages.call_args_list,
+            [call(secret_name='password', secret_version=None, region=self.region, rotated_before=None, page_size=100, exclusive_start_key=None)]
             )
+        assert_equals(3, mock_reencrypt_item_and_save.call_count)
+        assert_equals(3, summary['processed'])
 
-        assert_equals(
-            item,
-            output
-            )
+    def _rotation_table(self, *attrs):
+        # a mock table whose scans return one page of real Items, as _entry_pages reads them
+        self._items()
+        results = MagicMock(item_class=Item, response={'Items': list(attrs)}, last_evaluated_key=None)
+        self.mock_table.scan.return_value = results
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=self.mock_table)).start()
+        return
 
-    def test_GIVEN_secret_name_but_not_secret_version_provided_WHEN_update_secrets_called_THEN_proper_secrets_updated(self):
+    def test_GIVEN_real_items_WHEN_rotate_data_keys_called_with_workers_THEN_every_item_reencrypted_under_new_data_key(self):
         # GIVEN
-        secret_name = 'password'
-        secret_version = None
-        authorized_entities = ['Sterling Archer','Cyril Figgis']
+        old_key, new_key = b'o' * 32, b'n' * 32
+        self._rotation_table(*[{'secret_name': 'password', 'secret_version': version, 'encrypted_secret': encrypt_with_key('guest{0}'.format(version), old_key), 'encrypted_data_key': binascii.b2a_base64(b'old wrapped'), 'encryption_context': '{"Sterling Archer": "kaurna"}', 'authorized_entities': '["Sterling Archer"]'} for version in [1, 2]])
+        self.mock_kms.decrypt.return_value = {'Plaintext': old_key}
+        self.mock_kms.generate_data_key.return_value = {'Plaintext': new_key, 'CiphertextBlob': b'new wrapped'}
+
+        # WHEN
+        summary = rotate_data_keys(region=self.region, workers=2)
+
+        # THEN
+        assert_equals((2, 0), (summary['processed'], summary['failed']))
+        saved = sorted((c[0][0]['secret_version'], c[0][0]) for c in self.mock_table.layer2.update_item.call_args_list)
+        assert_equals(
+            [(1, 'guest1', binascii.b2a_base64(b'new wrapped')), (2, 'guest2', binascii.b2a_base64(b'new wrapped'))],
+            [(version, decrypt_with_key(item['encrypted_secret'], new_key), item['encrypted_data_key']) for version, item in saved]
+            )
+        assert_equals([call(ciphertext_blob=b'old wrapped', encryption_context={'Sterling Archer': 'kaurna'}, grant_tokens=None)] * 2, self.mock_kms.decrypt.call_args_list)
+
+    def test_GIVEN_real_items_WHEN_rotate_data_keys_called_with_workers_and_rewrap_THEN_every_data_key_rewrapped(self):
+        # GIVEN
+        self._rotation_table(*[{'secret_name': 'password', 'secret_version': version, 'encrypted_secret': 'encrypted_secret', 'encrypted_data_key': binascii.b2a_base64(b'old wrapped'), 'encryption_context': '{"Mallory Archer": "kaurna"}', 'authorized_entities': '["Sterling Archer"]'} for version in [1, 2]])
+        self.mock_kms.re_encrypt.return_value = {'CiphertextBlob': b'rewrapped'}
+
+        # WHEN
+        summary = rotate_data_keys(region=self.region, workers=2, rewrap=True)
+
+        # THEN
+        assert_equals((2, 0), (summary['processed'], summary['failed']))
+        assert_equals(
+            [(version, binascii.b2a_base64(b'rewrapped'), '{"Sterling Archer": "kaurna"}', 'encrypted_secret') for version in [1, 2]],
+            sorted((c[0][0]['secret_version'], c[0][0]['encrypted_data_key'], c[0][0]['encryption_context'], c[0][0]['encrypted_secret']) for c in self.mock_table.layer2.update_item.call_args_list)
+            )
+        assert_equals(0, self.mock_kms.generate_data_key.call_count)
+
+    def test_GIVEN_several_pages_WHEN__entry_pages_called_THEN_one_page_fetched_at_a_time(self):
+        # GIVEN
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        first_page = MagicMock(last_evaluated_key=('password', 2), response={'Items': [{'secret_version': 1}, {'secret_version': 2}]})
+        last_page = MagicMock(last_evaluated_key=None, response={'Items': [{'secret_version': 3}]})
+        mock_table.scan.side_effect = [first_page, last_page]
+        first_page.item_class.side_effect = last_page.item_class.side_effect = lambda table, attrs: attrs
+
+        # WHEN
+        pages = list(kaurna._entry_pages(region=self.region, page_size=2))
+
+        # THEN
+        assert_equals(pages, [([{'secret_version': 1}, {'secret_version': 2}], ('password', 2)), ([{'secret_version': 3}], None)])
+        assert_equals(
+            mock_table.scan.call_args_list,
+            [
+                call(scan_filter=None, attributes_to_get=None, request_limit=2, exclusive_start_key=None),
+                call(scan_filter=None, attributes_to_get=None, request_limit=2, exclusive_start_key=('password', 2))
+                ]
+            )
+
+    def test_WHEN__rewrap_item_and_save_called_THEN_only_data_key_reencrypted_and_saved(self):
+        # GIVEN
+        item, = self._items({
+            'secret_name': 'password',
+            'secret_version': 1,
+            'encrypted_secret': 'old_encrypted_secret',
+            'encrypted_data_key': 'old_encrypted_data_key',
+            'encryption_context': '{"Mallory Archer": "kaurna"}',
+            'authorized_entities': '["Sterling Archer"]'
+            })
+        mock_reencrypt_with_kms = patch('kaurna.reencrypt_with_kms', MagicMock(return_value='new_encrypted_data_key')).start()
+        patch('kaurna.time.time', Mock(return_value=1234.567)).start()
+
+        # WHEN
+        kaurna._rewrap_item_and_save(item=item, region=self.region)
+
+        # THEN
+        assert_equals(
+            mock_reencrypt_with_kms.call_args_list,
+            [call('old_encrypted_data_key', source_encryption_context={'Mallory Archer': 'kaurna'}, destination_encryption_context={'Sterling Archer': 'kaurna'}, region=self.region)]
+            )
+        assert_equals(
+            [(c[0][0], c[0][0]._updates) for c in self.mock_table.layer2.update_item.call_args_list],
+            [(item, {'authorized_entities': ('PUT', '["Sterling Archer"]'), 'encryption_context': ('PUT', '{"Sterling Archer": "kaurna"}'), 'encrypted_data_key': ('PUT', 'new_encrypted_data_key'), 'last_data_key_rotation': ('PUT', 1234)})]
+            )
+
+    def test_GIVEN_rewrap_WHEN_update_secrets_called_THEN_data_keys_rewrapped(self):
+        # GIVEN
+        item = {'secret_name': 'password', 'secret_version': 1, 'authorized_entities': '[]'}
+        patch('kaurna.load_all_entries', MagicMock(return_value=[item])).start()
+        mock_rewrap_item_and_save = patch('kaurna._rewrap_item_and_save').start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
+
+        # WHEN
+        update_secrets(secret_name='password', authorized_entities=['Sterling Archer'], region=self.region, rewrap=True)
+
+        # THEN
+        assert_equals(mock_rewrap_item_and_save.call_args_list, [call(item=item, region=self.region)])
+        assert_equals(0, mock_reencrypt_item_and_save.call_count)
+
+    def test_WHEN_reencrypt_with_kms_called_THEN_proper_kms_call_made(self):
+        # GIVEN
+        mock_kms = MagicMock()
+        mock_kms.re_encrypt.return_value = {'CiphertextBlob': 'new_blob'}
+        patch('kaurna._get_kms_connection', MagicMock(return_value=mock_kms)).start()
+
+        # WHEN
+        output = reencrypt_with_kms('b2xkX2Jsb2I=\n', source_encryption_context={'a': 'kaurna'}, destination_encryption_context={'b': 'kaurna'}, region=self.region)
+
+        # THEN
+        assert_equals('bmV3X2Jsb2I=\n', output)
+        assert_equals(
+            mock_kms.re_encrypt.call_args_list,
+            [call(ciphertext_blob='old_blob', destination_key_id='alias/kaurna', source_encryption_context={'a': 'kaurna'}, destination_encryption_context={'b': 'kaurna'}, grant_tokens=None)]
+            )
+
+    def test_WHEN__reencrypt_item_and_save_called_THEN_item_reencrypted_and_saved(self):
+        # GIVEN
+
+        item, = self._items({
+            'secret_name': 'password',
+            'secret_version': 1,
+            'encrypted_secret': 'old_encrypted_secret',
+            'encrypted_data_key': 'old_encrypted_data_key',
+            'encryption_context': '{"Mallory Archer": "kaurna"}',
+            'authorized_entities': '["Sterling Archer", "Cyril Figgis"]'
+            })
+
+        mock_get_data_key = MagicMock(return_value = {'Plaintext':'data_key_plaintext', 'CiphertextBlob':'data_key_ciphertext'})
+        patch(
+            'kaurna.get_data_key',
+            mock_get_data_key
+            ).start()
+
+        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': 'decrypt_with_kms_output'})
+        patch(
+            'kaurna.decrypt_with_kms',
+            mock_decrypt_with_kms
+            ).start()
+
+        mock_decrypt_with_key = MagicMock(return_value = 'decrypt_with_key_output')
+        patch(
+            'kaurna.decrypt_with_key',
+            mock_decrypt_with_key
+            ).start()
+
+        mock_encrypt_with_key = MagicMock(return_value = 'encrypt_with_key_output')
+        patch(
+            'kaurna.encrypt_with_key',
+            mock_encrypt_with_key
+            ).start()
+
+        patch(
+            'kaurna.time.time',
+            Mock(return_value = 1234.567)
+            ).start()
+
+        # WHEN
+
+        output = kaurna._reencrypt_item_and_save(item=item, region=self.region)
+
+        # THEN
+
+        assert_equals(
+            [(c[0][0], c[0][0]._updates) for c in self.mock_table.layer2.update_item.call_args_list],
+            [(item, {
+                'authorized_entities': ('PUT', '["Sterling Archer", "Cyril Figgis"]'),
+                'encryption_context': ('PUT', '{"Sterling Archer": "kaurna", "Cyril Figgis": "kaurna"}'),
+                'encrypted_secret': ('PUT', 'encrypt_with_key_output'),
+                'encrypted_data_key': ('PUT', 'ZGF0YV9rZXlfY2lwaGVydGV4dA==\n'),
+                'last_data_key_rotation': ('PUT', 1234)
+                })]
+            )
+
+        assert_equals(
+            item,
+            output
+            )
+
+    def test_GIVEN_secret_name_but_not_secret_version_provided_WHEN_update_secrets_called_THEN_proper_secrets_updated(self):
+        # GIVEN
+        secret_name = 'password'
+        secret_version = None
+        authorized_entities = ['Sterling Archer','Cyril Figgis']
 
         item1 = {'secret_name':secret_name, 'secret_version':1, 'authorized_entities':json.dumps(['Mallory Archer'])}
         expected_item1 = {'secret_name':secret_name, 'secret_version':1, 'authorized_entities':json.dumps(['Sterling Archer','Cyril Figgis'])}
-        item2 = {'secret_name':secret_name, 'secret':2, 'authorized_entities':json.dumps(['Algernop Krieger'])}
-        expected_item2 = {'secret_name':secret_name, 'secret':2, 'authorized_entities':json.dumps(['Sterling Archer','Cyril Figgis'])}
+        item2 = {'secret_name':secret_name, 'secret_version':2, 'authorized_entities':json.dumps(['Algernop Krieger'])}
+        expected_item2 = {'secret_name':secret_name, 'secret_version':2, 'authorized_entities':json.dumps(['Sterling Archer','Cyril Figgis'])}
         mock_load_all_entries = MagicMock(return_value = [item1, item2])
         patch(
             'kaurna.load_all_entries',
@@ -607,6 +1184,10 @@ class KaurnaUtilsTests(TestCase):
                 call(item=expected_item2, region=self.region)
                 ]
             )
+        assert_equals(
+            self.mock_update_entity_index.call_args_list,
+            [call([(secret_name, 1, ['Mallory Archer'], authorized_entities), (secret_name, 2, ['Algernop Krieger'], authorized_entities)], region=self.region)]
+            )
 
     def test_GIVEN_secret_name_and_secret_version_provided_WHEN_update_secrets_called_THEN_proper_secrets_updated(self):
         # GIVEN
@@ -643,6 +1224,33 @@ class KaurnaUtilsTests(TestCase):
                 ]
             )
 
+    def test_GIVEN_some_versions_already_have_the_entities_WHEN_update_secrets_called_THEN_only_changed_versions_reencrypted(self):
+        # GIVEN
+        same = {'secret_name': 'password', 'secret_version': 1, 'authorized_entities': json.dumps(['Cyril Figgis', 'Sterling Archer'])}
+        different = {'secret_name': 'password', 'secret_version': 2, 'authorized_entities': json.dumps(['Mallory Archer'])}
+        patch('kaurna.load_all_entries', MagicMock(return_value=[same, different])).start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
+
+        # WHEN
+        summary = update_secrets(secret_name='password', authorized_entities=['Sterling Archer', 'Cyril Figgis', 'Sterling Archer'], region=self.region)
+
+        # THEN
+        assert_equals({'changed': 1, 'unchanged': 1}, summary)
+        assert_equals([call(item=different, region=self.region)], mock_reencrypt_item_and_save.call_args_list)
+
+    def test_GIVEN_force_rotate_WHEN_update_secrets_called_THEN_unchanged_versions_reencrypted_too(self):
+        # GIVEN
+        same = {'secret_name': 'password', 'secret_version': 1, 'authorized_entities': json.dumps(['Sterling Archer'])}
+        patch('kaurna.load_all_entries', MagicMock(return_value=[same])).start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
+
+        # WHEN
+        summary = update_secrets(secret_name='password', authorized_entities=['Sterling Archer'], region=self.region, force_rotate=True)
+
+        # THEN
+        assert_equals({'changed': 1, 'unchanged': 0}, summary)
+        assert_equals(1, mock_reencrypt_item_and_save.call_count)
+
     @raises(Exception)
     def test_GIVEN_provided_secret_name_is_None_WHEN_erase_secret_called_THEN_error_thrown(self):
         # GIVEN
@@ -660,40 +1268,28 @@ class KaurnaUtilsTests(TestCase):
         secret_name = 'password'
         secret_version = None
 
-        item1 = MagicMock()
-        item2 = MagicMock()
-        item3 = MagicMock()
-        mock_load_all_entries = MagicMock(return_value = [item1, item2, item3])
+        items = [{'secret_name': secret_name, 'secret_version': version, 'authorized_entities': '["Sterling Archer"]'} for version in [1, 2, 3]]
+        mock_load_all_entries = MagicMock(return_value = items)
         patch(
             'kaurna.load_all_entries',
             mock_load_all_entries
             ).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
 
         # WHEN
-        erase_secret(secret_name=secret_name, secret_version=secret_version, region=self.region)
+        erased = erase_secret(secret_name=secret_name, secret_version=secret_version, region=self.region)
 
         # THEN
+        assert_equals(3, erased)
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
-            )
-        assert_equals(
-            item1.delete.call_args_list,
-            [
-                call()
-                ]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, attributes_to_get=['secret_name', 'secret_version', 'authorized_entities', 'blob_store', 'blob_key', 'chunk_count'])]
             )
         assert_equals(
-            item2.delete.call_args_list,
-            [
-                call()
-                ]
-            )
-        assert_equals(
-            item3.delete.call_args_list,
-            [
-                call()
-                ]
+            mock_batch_write.call_args_list,
+            [call(mock_table, deletes=[(secret_name, 1), (secret_name, 2), (secret_name, 3)])]
             )
 
     def test_GIVEN_secret_name_and_secret_version_provided_WHEN_erase_secret_called_THEN_proper_secret_erased(self):
@@ -701,12 +1297,15 @@ class KaurnaUtilsTests(TestCase):
         secret_name = 'password'
         secret_version = 2
 
-        item = MagicMock()
+        item = {'secret_name': secret_name, 'secret_version': secret_version, 'authorized_entities': '["Sterling Archer"]'}
         mock_load_all_entries = MagicMock(return_value = [item])
         patch(
             'kaurna.load_all_entries',
             mock_load_all_entries
             ).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
 
         # WHEN
         erase_secret(secret_name=secret_name, secret_version=secret_version, region=self.region)
@@ -714,15 +1313,63 @@ class KaurnaUtilsTests(TestCase):
         # THEN
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, attributes_to_get=['secret_name', 'secret_version', 'authorized_entities', 'blob_store', 'blob_key', 'chunk_count'])]
             )
         assert_equals(
-            item.delete.call_args_list,
-            [
-                call()
-                ]
+            mock_batch_write.call_args_list,
+            [call(mock_table, deletes=[(secret_name, secret_version)])]
+            )
+        assert_equals(
+            self.mock_update_entity_index.call_args_list,
+            [call([(secret_name, secret_version, ['Sterling Archer'], None)], region=self.region)]
+            )
+
+    def test_GIVEN_name_prefix_WHEN_erase_secrets_called_THEN_matching_secrets_scanned_for_and_erased(self):
+        # GIVEN
+        mock_table = MagicMock()
+        mock_table.scan.return_value = [{'secret_name': 'billing/db', 'secret_version': 1, 'authorized_entities': 'null'}, {'secret_name': 'billing/api', 'secret_version': 4, 'authorized_entities': 'null'}]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+
+        # WHEN
+        erased = erase_secrets(name_prefix='billing/', region=self.region)
+
+        # THEN
+        assert_equals(2, erased)
+        assert_equals(
+            mock_table.scan.call_args_list,
+            [call(scan_filter={'secret_name': BEGINS_WITH('billing/')}, attributes_to_get=['secret_name', 'secret_version', 'authorized_entities', 'blob_store', 'blob_key', 'chunk_count'])]
+            )
+        assert_equals(
+            mock_batch_write.call_args_list,
+            [call(mock_table, deletes=[('billing/db', 1), ('billing/api', 4)])]
+            )
+
+    def test_GIVEN_list_of_names_WHEN_erase_secrets_called_THEN_each_name_queried_and_all_erased_together(self):
+        # GIVEN
+        mock_table = MagicMock()
+        mock_table.query.side_effect = lambda hash_key, attributes_to_get: [{'secret_name': hash_key, 'secret_version': 1, 'authorized_entities': 'null'}]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        mock_batch_write = patch('kaurna._batch_write').start()
+
+        # WHEN
+        erased = erase_secrets(secret_names=['password', 'api_key'], region=self.region)
+
+        # THEN
+        assert_equals(2, erased)
+        assert_equals(
+            mock_batch_write.call_args_list,
+            [call(mock_table, deletes=[('password', 1), ('api_key', 1)])]
             )
 
+    @raises(Exception)
+    def test_GIVEN_names_and_prefix_WHEN_erase_secrets_called_THEN_error_thrown(self):
+        # WHEN
+        erase_secrets(secret_names=['password'], name_prefix='pass', region=self.region)
+
+        # THEN
+        # Exception should get thrown and we should never get here
+
     def test_GIVEN_seriously_is_False_WHEN_erase_all_the_things_called_THEN_nothing_happens(self):
         # GIVEN
         mock_table = MagicMock()
@@ -761,35 +1408,46 @@ class KaurnaUtilsTests(TestCase):
             [call()]
             )
 
+    def _items(self, *attrs):
+        # real layer2 Items on a mock table, so that save() records exactly what would be sent to UpdateItem
+        self.mock_table = MagicMock()
+        self.mock_table.schema.hash_key_name = 'secret_name'
+        self.mock_table.schema.range_key_name = 'secret_version'
+        # create the child mock now: two pool threads touching it for the first time at once can each create their own
+        self.mock_table.layer2.update_item
+        return [Item(self.mock_table, attrs=item_attrs) for item_attrs in attrs]
+
     def test_GIVEN_secret_name_but_not_secret_version_provided_WHEN_deprecate_secrets_called_THEN_proper_secrets_deprecated(self):
         # GIVEN
         secret_name = 'password'
         secret_version = None
 
-        item1 = MagicMock()
-        item2 = MagicMock()
-
-        mock_load_all_entries = MagicMock(return_value = [item1, item2])
+        item1, item2, item3 = self._items(
+            {'secret_name': secret_name, 'secret_version': 1, 'deprecated': 0},
+            {'secret_name': secret_name, 'secret_version': 2, 'deprecated': 1},
+            {'secret_name': secret_name, 'secret_version': 3, 'deprecated': 0}
+            )
+        mock_load_all_entries = MagicMock(return_value = [item1, item2, item3])
         patch(
             'kaurna.load_all_entries',
             mock_load_all_entries
             ).start()
 
         # WHEN
-        deprecate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
+        changed = deprecate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
 
         # THEN
+        assert_equals(2, changed)
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, attributes_to_get=['secret_name','secret_version','deprecated'], segments=None)]
             )
         assert_equals(
-            item1.mock_calls,
-            [call.__setitem__('deprecated', True), call.save()]
-            )
-        assert_equals(
-            item2.mock_calls,
-            [call.__setitem__('deprecated', True), call.save()]
+            sorted((c[0][0]['secret_version'], c[0][0]._updates, c[0][1]) for c in self.mock_table.layer2.update_item.call_args_list),
+            [
+                (1, {'deprecated': ('PUT', True)}, {'deprecated': 0}),
+                (3, {'deprecated': ('PUT', True)}, {'deprecated': 0})
+                ]
             )
 
     def test_GIVEN_secret_name_and_secret_version_provided_WHEN_deprecate_secrets_called_THEN_proper_secrets_deprecated(self):
@@ -797,8 +1455,7 @@ class KaurnaUtilsTests(TestCase):
         secret_name = 'password'
         secret_version = 2
 
-        item = MagicMock()
-
+        item, = self._items({'secret_name': secret_name, 'secret_version': 2, 'deprecated': 0})
         mock_load_all_entries = MagicMock(return_value = [item])
         patch(
             'kaurna.load_all_entries',
@@ -806,16 +1463,17 @@ class KaurnaUtilsTests(TestCase):
             ).start()
 
         # WHEN
-        deprecate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
+        changed = deprecate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
 
         # THEN
+        assert_equals(1, changed)
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, attributes_to_get=['secret_name','secret_version','deprecated'], segments=None)]
             )
         assert_equals(
-            item.mock_calls,
-            [call.__setitem__('deprecated', True), call.save()]
+            self.mock_table.layer2.update_item.call_args_list,
+            [call(item, {'deprecated': 0}, None)]
             )
 
     def test_GIVEN_secret_name_but_not_secret_version_provided_WHEN_activate_secrets_called_THEN_proper_secrets_activated(self):
@@ -823,9 +1481,10 @@ class KaurnaUtilsTests(TestCase):
         secret_name = 'password'
         secret_version = None
 
-        item1 = MagicMock()
-        item2 = MagicMock()
-
+        item1, item2 = self._items(
+            {'secret_name': secret_name, 'secret_version': 1, 'deprecated': 1},
+            {'secret_name': secret_name, 'secret_version': 2, 'deprecated': 0}
+            )
         mock_load_all_entries = MagicMock(return_value = [item1, item2])
         patch(
             'kaurna.load_all_entries',
@@ -833,47 +1492,36 @@ class KaurnaUtilsTests(TestCase):
             ).start()
 
         # WHEN
-        activate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
+        changed = activate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
 
         # THEN
+        assert_equals(1, changed)
         assert_equals(
             mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region, attributes_to_get=['secret_name','secret_version','deprecated'], segments=None)]
             )
         assert_equals(
-            item1.mock_calls,
-            [call.__setitem__('deprecated', False), call.save()]
-            )
-        assert_equals(
-            item2.mock_calls,
-            [call.__setitem__('deprecated', False), call.save()]
+            self.mock_table.layer2.update_item.call_args_list,
+            [call(item1, {'deprecated': 1}, None)]
             )
+        assert_equals({'deprecated': ('PUT', False)}, item1._updates)
 
     def test_GIVEN_secret_name_and_secret_version_provided_WHEN_activate_secrets_called_THEN_proper_secrets_activated(self):
         # GIVEN
         secret_name = 'password'
         secret_version = 2
 
-        item = MagicMock()
-
-        mock_load_all_entries = MagicMock(return_value = [item])
-        patch(
-            'kaurna.load_all_entries',
-            mock_load_all_entries
-            ).start()
+        item, = self._items({'secret_name': secret_name, 'secret_version': 2, 'deprecated': 1})
+        patch('kaurna.load_all_entries', MagicMock(return_value = [item])).start()
+        # someone else activates it between our read and our write
+        self.mock_table.layer2.update_item.side_effect = DynamoDBConditionalCheckFailedError(400, 'ConditionalCheckFailedException')
 
         # WHEN
-        activate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
+        changed = activate_secrets(secret_name=secret_name, secret_version=secret_version, region=self.region)
 
         # THEN
-        assert_equals(
-            mock_load_all_entries.call_args_list,
-            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
-            )
-        assert_equals(
-            item.mock_calls,
-            [call.__setitem__('deprecated', False), call.save()]
-            )
+        assert_equals(0, changed)
+        assert_equals(1, self.mock_table.layer2.update_item.call_count)
 
     def test_GIVEN_neither_secret_name_nor_secret_version_provided_WHEN_describe_secrets_called_THEN_proper_descriptions_returned(self):
         # GIVEN
@@ -906,13 +1554,19 @@ class KaurnaUtilsTests(TestCase):
                     'create_date': 1234,
                     'last_data_key_rotation': 2345,
                     'authorized_entities': ['Mallory Archer'],
-                    'deprecated': True
+                    'deprecated': True,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     },
                 2:{
                     'create_date': 2300,
                     'last_data_key_rotation': 2300,
                     'authorized_entities': ['Sterling Archer', 'Cyril Figgis'],
-                    'deprecated': False
+                    'deprecated': False,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     }
                 },
             'github_pem':
@@ -921,19 +1575,28 @@ class KaurnaUtilsTests(TestCase):
                     'create_date': 0001,
                     'last_data_key_rotation': 0003,
                     'authorized_entities': ['Algernop Krieger'],
-                    'deprecated': True
+                    'deprecated': True,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     },
                 3:{
                     'create_date': 0002,
                     'last_data_key_rotation': 0004,
                     'authorized_entities': ['Algernop Krieger'],
-                    'deprecated': True
+                    'deprecated': True,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     },
                 4:{
                     'create_date': 0003,
                     'last_data_key_rotation': 0005,
                     'authorized_entities': ['Algernop Krieger'],
-                    'deprecated': False
+                    'deprecated': False,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     },
                 }
             }
@@ -972,13 +1635,19 @@ class KaurnaUtilsTests(TestCase):
                     'create_date': 1234,
                     'last_data_key_rotation': 2345,
                     'authorized_entities': ['Mallory Archer'],
-                    'deprecated': True
+                    'deprecated': True,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     },
                 2:{
                     'create_date': 2300,
                     'last_data_key_rotation': 2300,
                     'authorized_entities': ['Sterling Archer', 'Cyril Figgis'],
-                    'deprecated': False
+                    'deprecated': False,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     }
                 }
             }
@@ -1015,7 +1684,10 @@ class KaurnaUtilsTests(TestCase):
                     'create_date': 2300,
                     'last_data_key_rotation': 2300,
                     'authorized_entities': ['Sterling Archer', 'Cyril Figgis'],
-                    'deprecated': False
+                    'deprecated': False,
+                        'secret_size': None,
+                        'stored_size': None,
+                        'compression': None
                     }
                 }
             }
@@ -1029,6 +1701,32 @@ class KaurnaUtilsTests(TestCase):
             actual_descriptions
             )
 
+    def test_WHEN_iter_secrets_called_THEN_one_record_yielded_per_item_as_items_are_read(self):
+        # GIVEN
+        item1 = {'secret_name': 'password', 'secret_version': 1, 'create_date': 1300, 'last_data_key_rotation': 1300, 'authorized_entities': '[]', 'deprecated': True}
+        item2 = {'secret_name': 'password', 'secret_version': 2, 'create_date': 2300, 'last_data_key_rotation': 2300, 'authorized_entities': '["Sterling Archer"]', 'deprecated': False}
+        read = []
+        def items():
+            for item in [item1, item2]:
+                read.append(item)
+                yield item
+        mock_load_all_entries = patch('kaurna.load_all_entries', Mock(return_value=items())).start()
+
+        # WHEN
+        records = iter_secrets(region=self.region, segments=4)
+        first = next(records)
+        read_after_first = len(read)
+        rest = list(records)
+
+        # THEN
+        assert_equals({'secret_name': 'password', 'secret_version': 1, 'create_date': 1300, 'last_data_key_rotation': 1300, 'authorized_entities': [], 'deprecated': True, 'secret_size': None, 'stored_size': None, 'compression': None}, first)
+        assert_equals(1, read_after_first)
+        assert_equals([['Sterling Archer']], [record['authorized_entities'] for record in rest])
+        assert_equals(
+            mock_load_all_entries.call_args_list,
+            [call(secret_name=None, secret_version=None, region=self.region, attributes_to_get=['secret_name','secret_version','create_date','last_data_key_rotation','authorized_entities','deprecated','secret_size','stored_size','compression'], segments=4)]
+            )
+
     @raises(Exception)
     def test_GIVEN_provided_secret_name_is_None_WHEN_get_secret_called_THEN_error_thrown(self):
         # GIVEN
@@ -1066,16 +1764,13 @@ class KaurnaUtilsTests(TestCase):
         secret_name = 'password'
         secret_version = None
 
-        patch(
-            'kaurna.load_all_entries',
-            Mock(
-                return_value = [
-                    {'secret_name':'password','deprecated':True,'secret_version':1},
-                    {'secret_name':'password','deprecated':True,'secret_version':2},
-                    {'secret_name':'password','deprecated':True,'secret_version':3}
-                    ]
-                )
-            ).start()
+        mock_table = MagicMock()
+        mock_table.query.return_value = [
+            {'secret_name':'password','deprecated':True,'secret_version':3},
+            {'secret_name':'password','deprecated':True,'secret_version':2},
+            {'secret_name':'password','deprecated':True,'secret_version':1}
+            ]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
 
         # WHEN
         get_secret(secret_name=secret_name, secret_version=secret_version)
@@ -1084,10 +1779,184 @@ class KaurnaUtilsTests(TestCase):
         # Exception should get thrown and we should never get here
 
     def test_GIVEN_secret_name_but_not_secret_version_provided_WHEN_get_secret_called_THEN_proper_secret_returned(self):
-        self.fail()
+        # GIVEN
+        secret_name = 'password'
+        secret_version = None
+
+        item3 = {'secret_name':'password','deprecated':True,'secret_version':3}
+        item2 = {'secret_name':'password','deprecated':False,'secret_version':2}
+        consumed = []
+        def newest_first_versions():
+            for item in [item3, item2, {'secret_name':'password','deprecated':False,'secret_version':1}]:
+                consumed.append(item['secret_version'])
+                yield item
+
+        mock_table = MagicMock()
+        mock_table.query.return_value = newest_first_versions()
+        mock_get_table = MagicMock(return_value=mock_table)
+        patch('kaurna.get_kaurna_table', mock_get_table).start()
+
+        mock_decrypt_item = MagicMock(return_value = 'guest')
+        patch(
+            'kaurna._decrypt_item',
+            mock_decrypt_item
+            ).start()
+
+        # WHEN
+        secret = get_secret(secret_name=secret_name, secret_version=secret_version, region=self.region)
+
+        # THEN
+        assert_equals('guest', secret)
+        assert_equals(
+            mock_table.query.call_args_list,
+            [call(hash_key=secret_name, attributes_to_get=None, request_limit=2, scan_index_forward=False)]
+            )
+        assert_equals(
+            mock_decrypt_item.call_args_list,
+            [call(item=item2, region=self.region)]
+            )
+        # versions older than the latest active one should never have been read
+        assert_equals([3, 2], consumed)
 
     def test_GIVEN_secret_name_and_secret_version_provided_WHEN_get_secret_called_THEN_proper_secret_returned(self):
-        self.fail()
+        # GIVEN
+        secret_name = 'password'
+        secret_version = 2
+
+        item = {'secret_name':'password','deprecated':False,'secret_version':2}
+        mock_load_all_entries = MagicMock(return_value = [item])
+        patch(
+            'kaurna.load_all_entries',
+            mock_load_all_entries
+            ).start()
+
+        mock_decrypt_item = MagicMock(return_value = 'guest')
+        patch(
+            'kaurna._decrypt_item',
+            mock_decrypt_item
+            ).start()
+
+        # WHEN
+        secret = get_secret(secret_name=secret_name, secret_version=secret_version, region=self.region)
+
+        # THEN
+        assert_equals('guest', secret)
+        assert_equals(
+            mock_load_all_entries.call_args_list,
+            [call(secret_name=secret_name, secret_version=secret_version, region=self.region)]
+            )
+        assert_equals(
+            mock_decrypt_item.call_args_list,
+            [call(item=item, region=self.region)]
+            )
+
+    def test_GIVEN_secret_cache_enabled_WHEN_get_secret_called_twice_THEN_secret_loaded_once(self):
+        # GIVEN
+        enable_secret_cache(ttl=60)
+        mock_load_secret = MagicMock(return_value = 'guest')
+        patch(
+            'kaurna._load_secret',
+            mock_load_secret
+            ).start()
+
+        # WHEN
+        first_secret = get_secret(secret_name='password', region=self.region)
+        second_secret = get_secret(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals('guest', first_secret)
+        assert_equals('guest', second_secret)
+        assert_equals(
+            mock_load_secret.call_args_list,
+            [call(secret_name='password', secret_version=None, region=self.region)]
+            )
+        assert_equals(1, get_secret_cache_stats()['hits'])
+        assert_equals(1, get_secret_cache_stats()['misses'])
+
+    def test_GIVEN_secret_cached_WHEN_secret_deprecated_THEN_cached_versions_invalidated(self):
+        # GIVEN
+        enable_secret_cache(ttl=60)
+        mock_load_secret = MagicMock(side_effect = ['guest', 'guest2', 'pem', 'guest3'])
+        patch(
+            'kaurna._load_secret',
+            mock_load_secret
+            ).start()
+        patch(
+            'kaurna.load_all_entries',
+            Mock(return_value = [])
+            ).start()
+        get_secret(secret_name='password', region=self.region)
+        get_secret(secret_name='password', secret_version=2, region=self.region)
+        get_secret(secret_name='private_key', region=self.region)
+
+        # WHEN
+        deprecate_secrets(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals('guest3', get_secret(secret_name='password', region=self.region))
+        assert_equals('pem', get_secret(secret_name='private_key', region=self.region))
+
+    def test_GIVEN_names_and_versions_WHEN_get_secrets_called_THEN_secrets_fetched_in_bulk_and_errors_reported(self):
+        # GIVEN
+        password_item = {'secret_name':'password', 'secret_version':2, 'deprecated':False, 'encrypted_secret':'<encrypted_password>', 'encrypted_data_key':'<shared_key>', 'encryption_context':'{"Sterling Archer": "kaurna"}'}
+        pem_item = {'secret_name':'github_pem', 'secret_version':3, 'deprecated':False, 'encrypted_secret':'<encrypted_pem>', 'encrypted_data_key':'<shared_key>', 'encryption_context':'{"Sterling Archer": "kaurna"}'}
+        old_item = {'secret_name':'github_pem', 'secret_version':1, 'deprecated':True, 'encrypted_secret':'<encrypted_old_pem>', 'encrypted_data_key':'<old_key>', 'encryption_context':'null'}
+
+        mock_table = MagicMock()
+        mock_table.batch_get_item.return_value = [pem_item, old_item]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        patch(
+            'kaurna._load_latest_active_entry',
+            MagicMock(side_effect = lambda secret_name, region: {'password': password_item}.get(secret_name))
+            ).start()
+
+        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': '<decrypted_data_key>'})
+        patch(
+            'kaurna.decrypt_with_kms',
+            mock_decrypt_with_kms
+            ).start()
+
+        patch(
+            'kaurna.decrypt_with_key',
+            MagicMock(side_effect = lambda ciphertext, key: ciphertext.replace('encrypted', 'decrypted'))
+            ).start()
+
+        # WHEN
+        secrets = get_secrets(['password', ('github_pem', '3'), ('github_pem', 1), 'missing'], region=self.region)
+
+        # THEN
+        assert_equals('<decrypted_password>', secrets['password'])
+        assert_equals('<decrypted_pem>', secrets[('github_pem', 3)])
+        assert isinstance(secrets[('github_pem', 1)], Exception)
+        assert isinstance(secrets['missing'], Exception)
+        assert_equals(4, len(secrets))
+        assert_equals(
+            mock_table.batch_get_item.call_args_list,
+            [call(keys=[('github_pem', 3), ('github_pem', 1)])]
+            )
+        assert_equals(
+            mock_decrypt_with_kms.call_args_list,
+            [call('<shared_key>', {'Sterling Archer': 'kaurna'}, region=self.region)]
+            )
+
+    def test_GIVEN_batch_read_fails_WHEN_get_secrets_called_THEN_only_versioned_secrets_fail(self):
+        # GIVEN
+        password_item = {'secret_name':'password', 'secret_version':2, 'deprecated':False, 'encrypted_secret':'<encrypted_password>', 'encrypted_data_key':'<key>', 'encryption_context':'null'}
+
+        mock_table = MagicMock()
+        mock_table.batch_get_item.side_effect = DynamoDBResponseError('Foo', 'Bar')
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        patch('kaurna._load_latest_active_entry', MagicMock(return_value=password_item)).start()
+        patch('kaurna.decrypt_with_kms', MagicMock(return_value = {'Plaintext': '<decrypted_data_key>'})).start()
+        patch('kaurna.decrypt_with_key', MagicMock(return_value = 'guest')).start()
+
+        # WHEN
+        secrets = get_secrets(['password', ('github_pem', 3)], region=self.region)
+
+        # THEN
+        assert_equals('guest', secrets['password'])
+        assert isinstance(secrets[('github_pem', 3)], DynamoDBResponseError)
 
     def test_GIVEN_valid_item_provided_WHEN__decrypt_item_called_THEN_proper_secret_returned(self):
         # GIVEN
@@ -1131,6 +2000,87 @@ class KaurnaUtilsTests(TestCase):
             [call('<encrypted_data_key>', {'Algernop Krieger':'kaurna'}, region=self.region)]
             )
 
+    def test_GIVEN_data_key_cache_enabled_WHEN_items_share_a_data_key_THEN_kms_called_once(self):
+        # GIVEN
+        enable_data_key_cache(max_age=60)
+        item1 = {
+            'encrypted_secret': '<encrypted_secret_1>',
+            'encrypted_data_key': '<encrypted_data_key>',
+            'encryption_context': '{"Algernop Krieger": "kaurna", "Cyril Figgis": "kaurna"}'
+            }
+        item2 = {
+            'encrypted_secret': '<encrypted_secret_2>',
+            'encrypted_data_key': '<encrypted_data_key>',
+            'encryption_context': '{"Cyril Figgis": "kaurna", "Algernop Krieger": "kaurna"}'
+            }
+
+        mock_decrypt_with_key = MagicMock(side_effect = ['<decrypted_secret_1>', '<decrypted_secret_2>'])
+        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': '<decrypted_data_key>'})
+        patch(
+            'kaurna.decrypt_with_key',
+            mock_decrypt_with_key
+            ).start()
+        patch(
+            'kaurna.decrypt_with_kms',
+            mock_decrypt_with_kms
+            ).start()
+
+        # WHEN
+        kaurna._decrypt_item(item=item1, region=self.region)
+        kaurna._decrypt_item(item=item2, region=self.region)
+
+        # THEN
+        assert_equals(
+            mock_decrypt_with_kms.call_args_list,
+            [call('<encrypted_data_key>', {'Algernop Krieger':'kaurna', 'Cyril Figgis':'kaurna'}, region=self.region)]
+            )
+        assert_equals(
+            mock_decrypt_with_key.call_args_list,
+            [call('<encrypted_secret_1>', '<decrypted_data_key>'), call('<encrypted_secret_2>', '<decrypted_data_key>')]
+            )
+        assert_equals(1, get_data_key_cache_stats()['hits'])
+        assert_equals(1, get_data_key_cache_stats()['misses'])
+
+    def test_GIVEN_data_key_cache_enabled_WHEN_encryption_context_differs_THEN_kms_called_again(self):
+        # GIVEN
+        enable_data_key_cache(max_age=60)
+        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': '<decrypted_data_key>'})
+        patch(
+            'kaurna.decrypt_with_kms',
+            mock_decrypt_with_kms
+            ).start()
+
+        # WHEN
+        kaurna._decrypt_data_key('<encrypted_data_key>', {'Algernop Krieger':'kaurna'}, region=self.region)
+        kaurna._decrypt_data_key('<encrypted_data_key>', {'Mallory Archer':'kaurna'}, region=self.region)
+
+        # THEN
+        assert_equals(
+            mock_decrypt_with_kms.call_args_list,
+            [
+                call('<encrypted_data_key>', {'Algernop Krieger':'kaurna'}, region=self.region),
+                call('<encrypted_data_key>', {'Mallory Archer':'kaurna'}, region=self.region)
+                ]
+            )
+
+    def test_GIVEN_data_key_cache_with_max_uses_WHEN_data_key_decrypted_repeatedly_THEN_loading_use_counted(self):
+        # GIVEN
+        enable_data_key_cache(max_age=60, max_uses=2)
+        mock_decrypt_with_kms = MagicMock(return_value = {'Plaintext': '<decrypted_data_key>'})
+        patch(
+            'kaurna.decrypt_with_kms',
+            mock_decrypt_with_kms
+            ).start()
+
+        # WHEN
+        plaintexts = [kaurna._decrypt_data_key('<encrypted_data_key>', {'Algernop Krieger':'kaurna'}, region=self.region) for i in range(5)]
+
+        # THEN
+        # uses 1 and 2 of the first load, 1 and 2 of the second, then a third load
+        assert_equals(['<decrypted_data_key>'] * 5, plaintexts)
+        assert_equals(3, mock_decrypt_with_kms.call_count)
+        assert_equals(2, get_data_key_cache_stats()['hits'])
+
     def test_GIVEN_iv_provided_WHEN_encrypt_with_key_called_THEN_plaintext_properly_encrypted(self):
         # GIVEN
         iv = base64.b64decode('kYSYMMqlQaVoUlXwmKUNLQ==')
@@ -1170,6 +2120,385 @@ class KaurnaUtilsTests(TestCase):
             actual_ciphertext
             )
 
+    def test_GIVEN_compression_and_large_secret_WHEN_store_secret_called_THEN_secret_compressed_before_encryption(self):
+        # GIVEN
+        secret = '{"type": "service_account", "private_key": "' + 'A' * 4000 + '"}'
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'abcdabcdabcdabcd', 'Plaintext': '1234123412341234'})).start()
+        mock_encrypt_with_key = patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        store_secret(secret_name='service_account', secret=secret, region=self.region, compression='zlib')
+
+        # THEN
+        attrs = mock_table.new_item.call_args[1]['attrs']
+        assert_equals('zlib', attrs['compression'])
+        assert_equals(len(secret), attrs['secret_size'])
+        assert_equals(len('<insert encrypted stuff here>'), attrs['stored_size'])
+        assert_equals(secret, zlib.decompress(mock_encrypt_with_key.call_args[1]['plaintext']))
+
+    def test_GIVEN_small_or_incompressible_secret_WHEN_store_secret_called_THEN_secret_stored_uncompressed(self):
+        # GIVEN
+        small_secret = 'guest' * 10
+        random_secret = base64.b64decode('E/knR0ElllVyrTt3FkrTvI4mwvLdoCTR6mf2KtkAAXg=') * 2
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'abcdabcdabcdabcd', 'Plaintext': '1234123412341234'})).start()
+        mock_encrypt_with_key = patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        store_secret(secret_name='password', secret=small_secret, region=self.region, compression='zlib')
+        store_secret(secret_name='key', secret=random_secret, region=self.region, compression='bz2', compression_threshold=0)
+
+        # THEN
+        assert_equals([False, False], ['compression' in c[1]['attrs'] for c in mock_table.new_item.call_args_list])
+        assert_equals([small_secret, random_secret], [c[1]['plaintext'] for c in mock_encrypt_with_key.call_args_list])
+
+    def test_GIVEN_non_ascii_text_secrets_WHEN_store_secret_called_THEN_sizes_measured_in_utf8_bytes(self):
+        # GIVEN
+        short_secret = u'h\xe9llo'
+        # 600 characters but 1200 bytes, so over the compression threshold
+        long_secret = u'\xe9' * 600
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'abcdabcdabcdabcd', 'Plaintext': '1234123412341234'})).start()
+        mock_encrypt_with_key = patch('kaurna.encrypt_with_key', Mock(return_value='<insert encrypted stuff here>')).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        store_secret(secret_name='password', secret=short_secret, region=self.region)
+        store_secret(secret_name='greeting', secret=long_secret, region=self.region, compression='zlib')
+
+        # THEN
+        attrs = [c[1]['attrs'] for c in mock_table.new_item.call_args_list]
+        assert_equals([6, 1200], [item_attrs['secret_size'] for item_attrs in attrs])
+        assert_equals([None, 'zlib'], [item_attrs.get('compression') for item_attrs in attrs])
+        assert_equals(long_secret.encode('utf-8'), zlib.decompress(mock_encrypt_with_key.call_args[1]['plaintext']))
+
+    @raises(Exception)
+    def test_GIVEN_unknown_compression_WHEN_store_secret_called_THEN_error_thrown(self):
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'abcdabcdabcdabcd', 'Plaintext': '1234123412341234'})).start()
+        store_secret(secret_name='password', secret='guest' * 1000, region=self.region, compression='rot13')
+
+    def test_GIVEN_compressed_item_WHEN_secret_read_THEN_secret_decompressed(self):
+        # GIVEN
+        secret = 'A' * 5000
+        item = {'secret_name': 'service_account', 'secret_version': 1, 'encrypted_secret': '<encrypted_secret>', 'encrypted_data_key': '<encrypted_data_key>', 'encryption_context': 'null', 'deprecated': False, 'compression': 'bz2'}
+        patch('kaurna.decrypt_with_kms', MagicMock(return_value={'Plaintext': '<decrypted_data_key>'})).start()
+        patch('kaurna.decrypt_with_key', MagicMock(return_value=bz2.compress(secret))).start()
+        patch('kaurna.decrypt_with_keys', MagicMock(return_value=[bz2.compress(secret)])).start()
+        mock_table = MagicMock()
+        mock_table.batch_get_item.return_value = [item]
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        single = kaurna._decrypt_item(item=item, region=self.region)
+        batch = get_secrets([('service_account', 1)], region=self.region)
+
+        # THEN
+        assert_equals(secret, single)
+        assert_equals({('service_account', 1): secret}, batch)
+
+    def test_GIVEN_gcm_available_WHEN_encrypt_with_key_v2_called_THEN_secret_round_trips_bound_to_encryption_context(self):
+        # GIVEN
+        if not hasattr(AES, 'MODE_GCM'):
+            raise SkipTest('format 2 needs pycryptodome')
+        key = base64.b64decode('E/knR0ElllVyrTt3FkrTvI4mwvLdoCTR6mf2KtkAAXg=')
+        context = {'Sterling Archer': 'kaurna', 'Cyril Figgis': 'kaurna'}
+
+        # WHEN
+        blob = encrypt_with_key_v2(b'This is a test message.', key, context)
+
+        # THEN
+        assert_equals(b'\x02', blob[:1])
+        assert_equals(1 + 12 + 23 + 16, len(blob))
+        assert_equals(b'This is a test message.', decrypt_with_key_v2(blob, key, {'Cyril Figgis': 'kaurna', 'Sterling Archer': 'kaurna'}))
+        try:
+            decrypt_with_key_v2(blob, key, {'Sterling Archer': 'kaurna'})
+            self.fail('decrypted under the wrong encryption context')
+        except Exception as e:
+            assert_equals(True, 'failed authentication' in str(e))
+
+    @raises(Exception)
+    def test_GIVEN_unknown_version_byte_WHEN_decrypt_with_key_v2_called_THEN_error_thrown(self):
+        decrypt_with_key_v2(b'\x03' + b'\0' * 40, b'\0' * 32)
+
+    def test_GIVEN_format_2_item_WHEN__decrypt_item_called_THEN_binary_attributes_decrypted_with_v2(self):
+        # GIVEN
+        item = {
+            'encrypted_secret': Binary(b'\x02<encrypted_secret>'),
+            'encrypted_data_key': Binary(b'<encrypted_data_key>'),
+            'encryption_context': '{"Algernop Krieger": "kaurna"}'
+            }
+        mock_decrypt_with_kms = patch('kaurna.decrypt_with_kms', MagicMock(return_value={'Plaintext': '<decrypted_data_key>'})).start()
+        mock_decrypt_with_key = patch('kaurna.decrypt_with_key').start()
+        mock_decrypt_with_key_v2 = patch('kaurna.decrypt_with_key_v2', MagicMock(return_value='guest')).start()
+
+        # WHEN
+        secret = kaurna._decrypt_item(item=item, region=self.region)
+
+        # THEN
+        assert_equals('guest', secret)
+        assert_equals([call(binascii.b2a_base64(b'<encrypted_data_key>'), {'Algernop Krieger': 'kaurna'}, region=self.region)], mock_decrypt_with_kms.call_args_list)
+        assert_equals([call(b'\x02<encrypted_secret>', '<decrypted_data_key>', {'Algernop Krieger': 'kaurna'})], mock_decrypt_with_key_v2.call_args_list)
+        assert_equals(0, mock_decrypt_with_key.call_count)
+
+    def test_GIVEN_format_2_WHEN_store_secret_called_THEN_binary_attributes_stored(self):
+        # GIVEN
+        patch('kaurna._latest_secret_version', MagicMock(return_value=0)).start()
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'abcdabcdabcdabcd', 'Plaintext': '1234123412341234'})).start()
+        mock_encrypt_with_key_v2 = patch('kaurna.encrypt_with_key_v2', MagicMock(return_value=b'\x02<encrypted stuff>')).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+
+        # WHEN
+        store_secret(secret_name='password', secret='guest', authorized_entities=['Sterling Archer'], region=self.region, format_version=2)
+
+        # THEN
+        attrs = mock_table.new_item.call_args[1]['attrs']
+        assert_equals(Binary(b'\x02<encrypted stuff>'), attrs['encrypted_secret'])
+        assert_equals(Binary(b'abcdabcdabcdabcd'), attrs['encrypted_data_key'])
+        assert_equals(True, isinstance(attrs['encrypted_secret'], Binary))
+        assert_equals([call('guest', '1234123412341234', {'Sterling Archer': 'kaurna'})], mock_encrypt_with_key_v2.call_args_list)
+
+    @raises(Exception)
+    def test_GIVEN_unknown_format_WHEN_migrate_secrets_called_THEN_error_thrown(self):
+        migrate_secrets(format_version=3, region=self.region)
+
+    def test_GIVEN_mixed_formats_WHEN_migrate_secrets_called_THEN_only_old_items_rewritten_with_same_data_key(self):
+        # GIVEN
+        old, new = self._items(
+            {'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': 'b2xk', 'encrypted_data_key': binascii.b2a_base64(b'wrapped'), 'encryption_context': '{"webapp": "kaurna"}'},
+            {'secret_name': 'password', 'secret_version': 2, 'encrypted_secret': Binary(b'\x02new'), 'encrypted_data_key': Binary(b'wrapped'), 'encryption_context': 'null'}
+            )
+        patch('kaurna.load_all_entries', MagicMock(return_value=[old, new])).start()
+        mock_decrypt_with_kms = patch('kaurna.decrypt_with_kms', MagicMock(return_value={'Plaintext': 'data_key'})).start()
+        patch('kaurna.decrypt_with_key', MagicMock(return_value='guest')).start()
+        mock_encrypt_with_key_v2 = patch('kaurna.encrypt_with_key_v2', MagicMock(return_value=b'\x02migrated')).start()
+
+        # WHEN
+        summary = migrate_secrets(secret_name='password', region=self.region)
+
+        # THEN
+        assert_equals({'migrated': 1, 'unchanged': 1}, summary)
+        assert_equals([call(binascii.b2a_base64(b'wrapped'), {'webapp': 'kaurna'}, region=self.region)], mock_decrypt_with_kms.call_args_list)
+        assert_equals([call('guest', 'data_key', {'webapp': 'kaurna'})], mock_encrypt_with_key_v2.call_args_list)
+        assert_equals(
+            [(c[0][0]['secret_version'], c[0][0]._updates['encrypted_secret'], c[0][0]._updates['encrypted_data_key'], c[0][1]) for c in self.mock_table.layer2.update_item.call_args_list],
+            [(1, ('PUT', Binary(b'\x02migrated')), ('PUT', Binary(b'wrapped')), {'encrypted_data_key': binascii.b2a_base64(b'wrapped')})]
+            )
+
+    def test_GIVEN_item_rotated_meanwhile_WHEN_migrate_secrets_called_THEN_item_not_counted(self):
+        # GIVEN
+        item, = self._items({'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': 'b2xk', 'encrypted_data_key': 'd3JhcHBlZA==\n', 'encryption_context': 'null'})
+        patch('kaurna.load_all_entries', MagicMock(return_value=[item])).start()
+        patch('kaurna.decrypt_with_kms', MagicMock(return_value={'Plaintext': 'data_key'})).start()
+        patch('kaurna.decrypt_with_key', MagicMock(return_value='guest')).start()
+        patch('kaurna.encrypt_with_key_v2', MagicMock(return_value=b'\x02migrated')).start()
+        self.mock_table.layer2.update_item.side_effect = DynamoDBConditionalCheckFailedError(400, 'ConditionalCheckFailed')
+
+        # WHEN
+        summary = migrate_secrets(region=self.region)
+
+        # THEN
+        assert_equals({'migrated': 0, 'unchanged': 0}, summary)
+
+    def test_GIVEN_format_2_item_WHEN__rewrap_item_and_save_called_THEN_item_reencrypted_instead(self):
+        # GIVEN
+        item, = self._items({'secret_name': 'password', 'secret_version': 1, 'encrypted_secret': Binary(b'\x02secret'), 'encrypted_data_key': Binary(b'wrapped')})
+        mock_reencrypt_with_kms = patch('kaurna.reencrypt_with_kms').start()
+        mock_reencrypt_item_and_save = patch('kaurna._reencrypt_item_and_save').start()
+
+        # WHEN
+        kaurna._rewrap_item_and_save(item=item, region=self.region)
+
+        # THEN
+        assert_equals([call(item=item, region=self.region)], mock_reencrypt_item_and_save.call_args_list)
+        assert_equals(0, mock_reencrypt_with_kms.call_count)
+
+    def _local_blob_store(self):
+        # a LocalBlobStore in a temporary directory, registered as 'local' for the length of the test
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = LocalBlobStore(directory)
+        patch.dict('kaurna._blob_stores', {'local': store}).start()
+        return store
+
+    def _store_chunked_secret(self, secret, chunk_size=100, **kwargs):
+        # stores secret with store_secret_stream in a local blob store, and returns the attributes of the new item
+        self.data_key = base64.b64decode('E/knR0ElllVyrTt3FkrTvI4mwvLdoCTR6mf2KtkAAXg=')
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'wrapped', 'Plaintext': self.data_key})).start()
+        patch('kaurna.decrypt_with_kms', Mock(return_value={'Plaintext': self.data_key})).start()
+        patch('kaurna._latest_secret_version', MagicMock(return_value=2)).start()
+        mock_table = MagicMock()
+        patch('kaurna.get_kaurna_table', MagicMock(return_value=mock_table)).start()
+        store_secret_stream(secret_name='kubeconfig', stream=io.BytesIO(secret), authorized_entities=['Sterling Archer'], region=self.region, blob_store='local', chunk_size=chunk_size, **kwargs)
+        return mock_table.new_item.call_args[1]['attrs']
+
+    def test_WHEN_store_secret_stream_called_THEN_secret_stored_in_encrypted_chunks_and_readable(self):
+        # GIVEN
+        store = self._local_blob_store()
+        secret = b'apiVersion: v1\n' + b'x' * 335
+
+        # WHEN
+        attrs = self._store_chunked_secret(secret)
+
+        # THEN
+        assert_equals(('kubeconfig', 3, 'local', 4, 350), (attrs['secret_name'], attrs['secret_version'], attrs['blob_store'], attrs['chunk_count'], attrs['secret_size']))
+        assert_equals(False, 'encrypted_secret' in attrs)
+        assert_equals(binascii.b2a_base64(b'wrapped'), attrs['encrypted_data_key'])
+        chunks = list(store.read(attrs['blob_key'], 4))
+        assert_equals(4, len(chunks))
+        assert_equals(False, any(b'xxxx' in chunk for chunk in chunks))
+        assert_equals([call([('kubeconfig', 3, None, ['Sterling Archer'])], region=self.region)], self.mock_update_entity_index.call_args_list)
+        assert_equals(secret, kaurna._decrypt_item(item=attrs, region=self.region))
+
+    def test_GIVEN_chunked_secret_WHEN_get_secret_stream_called_THEN_plaintext_yielded_chunk_by_chunk(self):
+        # GIVEN
+        self._local_blob_store()
+        secret = b'y' * 250
+        attrs = self._store_chunked_secret(secret)
+        patch('kaurna._load_latest_active_entry', MagicMock(return_value=attrs)).start()
+
+        # WHEN
+        pieces = list(get_secret_stream(secret_name='kubeconfig', region=self.region))
+
+        # THEN
+        assert_equals([b'y' * 100, b'y' * 100, b'y' * 50], pieces)
+
+    def test_GIVEN_chunk_missing_WHEN_chunked_secret_read_THEN_error_thrown(self):
+        # GIVEN
+        store = self._local_blob_store()
+        attrs = self._store_chunked_secret(b'z' * 250)
+        os.remove(store._path(attrs['blob_key'], 2))
+
+        # WHEN
+        try:
+            kaurna._decrypt_item(item=attrs, region=self.region)
+            self.fail('read an incomplete secret')
+        except Exception as e:
+            error = str(e)
+
+        # THEN
+        assert_equals('Secret \'kubeconfig\' version 3 is incomplete: found 2 of its 3 chunks.', error)
+
+    def test_GIVEN_version_taken_WHEN_store_secret_stream_called_THEN_chunks_cleaned_up(self):
+        # GIVEN
+        store = self._local_blob_store()
+        patch('kaurna._put_new_item', MagicMock(side_effect=Exception('To update an existing secret/version, please use update_secrets, or use delete_secret to delete the secret/version first.'))).start()
+
+        # WHEN
+        try:
+            self._store_chunked_secret(b'z' * 250, secret_version=1)
+            self.fail('stored over an existing version')
+        except Exception as e:
+            pass
+
+        # THEN
+        assert_equals([], os.listdir(store.directory))
+        assert_equals(0, self.mock_update_entity_index.call_count)
+
+    def test_GIVEN_chunked_secret_WHEN_data_key_rotated_THEN_chunks_reencrypted_into_new_blob(self):
+        # GIVEN
+        store = self._local_blob_store()
+        secret = b'w' * 250
+        item, = self._items(self._store_chunked_secret(secret, format_version=2 if hasattr(AES, 'MODE_GCM') else 1))
+        old_blob_key = item['blob_key']
+        new_data_key = base64.b64decode('b638ba+zFUD8LGvnIOBXas1BWDEb90CwYBNbqYh9NeQ=')
+        patch('kaurna.get_data_key', Mock(return_value={'CiphertextBlob': 'rotated', 'Plaintext': new_data_key})).start()
+        item['authorized_entities'] = '["Cyril Figgis"]'
+        patch('kaurna.load_all_entries', MagicMock(return_value=[item])).start()
+
+        # WHEN
+        rotate_data_keys(secret_name='kubeconfig', region=self.region)
+
+        # THEN
+        assert_equals(False, old_blob_key == item['blob_key'])
+        assert_equals(False, os.path.exists(store._path(old_blob_key)))
+        assert_equals('{"Cyril Figgis": "kaurna"}', item['encryption_context'])
+        assert_equals(1, self.mock_table.layer2.update_item.call_count)
+        patch('kaurna.decrypt_with_kms', Mock(return_value={'Plaintext': new_data_key})).start()
+        assert_equals(secret, kaurna._decrypt_item(item=item, region=self.region))
+
+    def test_GIVEN_chunked_secret_WHEN_data_key_rewrapped_THEN_chunks_left_alone(self):
+        # GIVEN
+        self._local_blob_store()
+        item, = self._items(self._store_chunked_secret(b'w' * 250))
+        old_blob_key = item['blob_key']
+        mock_reencrypt_with_kms = patch('kaurna.reencrypt_with_kms', MagicMock(return_value=binascii.b2a_base64(b'rewrapped'))).start()
+        item['authorized_entities'] = '["Cyril Figgis"]'
+
+        # WHEN
+        kaurna._rotate_item_and_save(item=item, region=self.region, rewrap=True)
+
+        # THEN
+        assert_equals(old_blob_key, item['blob_key'])
+        assert_equals(binascii.b2a_base64(b'rewrapped'), item['encrypted_data_key'])
+        assert_equals([call(binascii.b2a_base64(b'wrapped'), source_encryption_context={'Sterling Archer': 'kaurna'}, destination_encryption_context={'Cyril Figgis': 'kaurna'}, region=self.region)], mock_reencrypt_with_kms.call_args_list)
+        assert_equals(b'w' * 250, kaurna._decrypt_item(item=item, region=self.region))
+
+    def test_GIVEN_chunked_secret_WHEN_erase_secret_called_THEN_chunks_deleted(self):
+        # GIVEN
+        store = self._local_blob_store()
+        attrs = self._store_chunked_secret(b'w' * 250)
+        patch('kaurna.load_all_entries', MagicMock(return_value=[attrs])).start()
+        patch('kaurna._batch_write').start()
+
+        # WHEN
+        erased = erase_secret(secret_name='kubeconfig', region=self.region)
+
+        # THEN
+        assert_equals(1, erased)
+        assert_equals([], os.listdir(store.directory))
+
+    def _crypto_batch(self):
+        keys = [base64.b64decode('E/knR0ElllVyrTt3FkrTvI4mwvLdoCTR6mf2KtkAAXg='), base64.b64decode('b638ba+zFUD8LGvnIOBXas1BWDEb90CwYBNbqYh9NeQ=')]
+        plaintexts = ['This is a test message.', '', 'x' * 16, 'y' * 100, '{"password": "guest"}']
+        pairs = [(plaintext, keys[i % 2]) for i, plaintext in enumerate(plaintexts * 3)]
+        ivs = [chr(i) * 16 for i in range(len(pairs))]
+        return pairs, ivs
+
+    def test_WHEN_encrypt_with_keys_called_THEN_output_matches_encrypt_with_key(self):
+        # GIVEN
+        pairs, ivs = self._crypto_batch()
+
+        # WHEN
+        ciphertexts = encrypt_with_keys(pairs, ivs=ivs)
+
+        # THEN
+        assert_equals([encrypt_with_key(plaintext=plaintext, key=key, iv=iv) for (plaintext, key), iv in zip(pairs, ivs)], ciphertexts)
+
+    def test_WHEN_decrypt_with_keys_called_THEN_output_matches_decrypt_with_key(self):
+        # GIVEN
+        pairs, ivs = self._crypto_batch()
+        encrypted = [(encrypt_with_key(plaintext=plaintext, key=key, iv=iv), key) for (plaintext, key), iv in zip(pairs, ivs)]
+
+        # WHEN
+        plaintexts = decrypt_with_keys(encrypted)
+
+        # THEN
+        assert_equals([plaintext for plaintext, key in pairs], plaintexts)
+
+    def test_GIVEN_processes_and_big_batch_WHEN_decrypt_with_keys_called_THEN_batch_split_across_process_pool(self):
+        # GIVEN
+        patch('kaurna.PROCESS_POOL_MIN_BATCH', 4).start()
+        pairs, ivs = self._crypto_batch()
+        encrypted = [(encrypt_with_key(plaintext=plaintext, key=key, iv=iv), key) for (plaintext, key), iv in zip(pairs, ivs)]
+        mock_pool = MagicMock()
+        mock_pool.map.side_effect = lambda function, chunks: [function(chunk) for chunk in chunks]
+        mock_pool_class = patch('kaurna.multiprocessing.Pool', MagicMock(return_value=mock_pool)).start()
+
+        # WHEN
+        plaintexts = decrypt_with_keys(encrypted, processes=2)
+
+        # THEN
+        assert_equals([plaintext for plaintext, key in pairs], plaintexts)
+        assert_equals([call(2)], mock_pool_class.call_args_list)
+        assert_equals([8, 7], [len(chunk) for chunk in mock_pool.map.call_args[0][1]])
+
     def test_WHEN_decrypt_with_key_called_THEN_plaintext_properly_decrypted(self):
         # GIVEN
         key = base64.b64decode('E/knR0ElllVyrTt3FkrTvI4mwvLdoCTR6mf2KtkAAXg=')